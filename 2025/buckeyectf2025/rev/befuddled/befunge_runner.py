@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import sys
+import time
 import random
+from collections import OrderedDict
 
 
 def load_program(path: str) -> list[list[int]]:
@@ -33,9 +35,16 @@ class RunStatus:
     OK = 'ok'
     NEED_INPUT = 'need_input'
     HALTED = 'halted'
+    LIMIT = 'step_limit'
 
 
-def run_befunge(grid: list[list[int]], input_data: bytes, trace: bool = False, stop_on_need_input: bool = False):
+MASK = 0xFFFFFFFFFFFFFFFF
+MAX_STEPS = 10_000_000
+DIRECTIONS = [(1,0),(-1,0),(0,1),(0,-1)]
+
+
+def run_befunge_stepwise(grid: list[list[int]], input_data: bytes, trace: bool = False, stop_on_need_input: bool = False):
+    """Reference interpreter decoding one cell per step, kept to check and benchmark the VM."""
     H, W = len(grid), len(grid[0])
     x, y = 0, 0
     dx, dy = 1, 0  # start moving right
@@ -55,7 +64,7 @@ def run_befunge(grid: list[list[int]], input_data: bytes, trace: bool = False, s
     read_char_count = 0
     while True:
         ip_steps += 1
-        if ip_steps > 10_000_000:
+        if ip_steps > MAX_STEPS:
             raise RuntimeError("Too many steps; possible infinite loop")
         instr = grid[y][x]
         if instr == 0xFF:
@@ -101,7 +110,7 @@ def run_befunge(grid: list[list[int]], input_data: bytes, trace: bool = False, s
             elif ch == 'v':
                 dx, dy = 0, 1
             elif ch == '?':
-                dx, dy = random.choice([(1,0),(-1,0),(0,1),(0,-1)])
+                dx, dy = random.choice(DIRECTIONS)
             elif ch == '_':
                 a = pop()
                 dx, dy = (1,0) if a == 0 else (-1,0)
@@ -194,16 +203,548 @@ def run_befunge(grid: list[list[int]], input_data: bytes, trace: bool = False, s
     return bytes(out), status, inp_i, (x, y), list(stack), read_char_count, grid
 
 
+# --- Compiled engine -------------------------------------------------------
+#
+# Between two instructions that depend on run-time state (a branch, '?', an
+# input read, a 'p' or '@') the path of the IP is fixed by the grid alone.
+# Such a straight run of cells is compiled once into a Python function, and
+# the VM only dispatches the terminating instruction, where the hooks are
+# called. Blocks are keyed by (x, y, dx, dy, string_mode) and cached per
+# program, so repeated runs of the same grid (e.g. a solver trying many
+# inputs) reuse them.
+#
+# Two dialects share the engine: the bounded one of run_befunge (64-bit
+# wrapping cells, '/' truncating) and the unbounded one the gate analysis was
+# written against (Python integers, '/' and '%' flooring).
+
+TERMINATORS = frozenset('_|?p&~@')
+OUTPUTS = frozenset('.,')
+MAX_BLOCK = 256            # cells per block, bounds loops without a terminator
+PROGRAM_CACHE_SIZE = 16
+
+# Binary operators: (value when folding constants, generated code)
+BINARY = {
+    '+': (lambda b, a: (b + a) & MASK, '(b + {a}) & MASK'),
+    '-': (lambda b, a: (b - a) & MASK, '(b - {a}) & MASK'),
+    '*': (lambda b, a: (b * a) & MASK, '(b * {a}) & MASK'),
+    '/': (lambda b, a: 0 if a == 0 else int(b / a) & MASK, '0 if {a} == 0 else int(b / {a}) & MASK'),
+    '%': (lambda b, a: 0 if a == 0 else (b % a) & MASK, '0 if {a} == 0 else (b % {a}) & MASK'),
+    '`': (lambda b, a: 1 if b > a else 0, '1 if b > {a} else 0'),
+}
+BINARY_UNBOUNDED = {
+    '+': (lambda b, a: b + a, 'b + {a}'),
+    '-': (lambda b, a: b - a, 'b - {a}'),
+    '*': (lambda b, a: b * a, 'b * {a}'),
+    '/': (lambda b, a: 0 if a == 0 else b // a, '0 if {a} == 0 else b // {a}'),
+    '%': (lambda b, a: 0 if a == 0 else b % a, '0 if {a} == 0 else b % {a}'),
+    '`': (lambda b, a: 1 if b > a else 0, '1 if b > {a} else 0'),
+}
+MOVES = {'>': (1, 0), '<': (-1, 0), '^': (0, -1), 'v': (0, 1)}
+
+
+class Block:
+    __slots__ = ('run', 'steps', 'cells', 'kind', 'x', 'y', 'dx', 'dy', 'string_mode')
+
+    def __init__(self, run, steps, cells, kind, x, y, dx, dy, string_mode):
+        self.run = run                  # function(stack, out, grid) or None
+        self.steps = steps              # instructions executed, terminator included
+        self.cells = cells              # cells whose instruction was compiled in
+        self.kind = kind                # terminator, or None to continue at (x, y)
+        self.x, self.y = x, y           # terminator cell, or next cell
+        self.dx, self.dy = dx, dy
+        self.string_mode = string_mode
+
+
+def compile_block(grid: list[list[int]], x: int, y: int, dx: int, dy: int, string_mode: bool,
+                  bounded: bool = True, terminators: frozenset = TERMINATORS,
+                  max_block: int = MAX_BLOCK) -> Block:
+    H, W = len(grid), len(grid[0])
+    binary = BINARY if bounded else BINARY_UNBOUNDED
+    mask = MASK if bounded else -1
+    masked = ' & MASK' if bounded else ''
+    code: list[str] = []
+    pending: list[int] = []    # constants pushed by the block, not yet emitted
+    cells = set()
+    steps = 0
+
+    def flush():
+        if len(pending) == 1:
+            code.append(f"push({pending[0]})")
+        elif pending:
+            code.append(f"st.extend({tuple(pending)!r})")
+        pending.clear()
+
+    kind = None
+    while steps < max_block:
+        instr = grid[y][x]
+        if instr == 0xFF:
+            instr = ord(' ')
+        ch = chr(instr)
+        cells.add((x, y))
+        steps += 1
+        if string_mode:
+            if ch == '"':
+                string_mode = False
+            else:
+                pending.append(instr & mask)
+        elif ch in terminators:
+            kind = ch
+            break
+        elif '0' <= ch <= '9':
+            pending.append(instr - ord('0'))
+        elif ch in binary:
+            fold, expr = binary[ch]
+            if len(pending) >= 2:
+                a = pending.pop()
+                pending.append(fold(pending.pop(), a))
+            else:
+                a = repr(pending.pop()) if pending else 'a'
+                flush()
+                if a == 'a':
+                    code.append("a = pop() if st else 0")
+                code.append("b = pop() if st else 0")
+                code.append(f"push({expr.format(a=a)})")
+        elif ch == '!':
+            if pending:
+                pending.append(0 if pending.pop() else 1)
+            else:
+                code.append("push(0 if st and pop() else 1)")
+        elif ch == ':':
+            if pending:
+                pending.append(pending[-1])
+            else:
+                code.append("push(st[-1]) if st else st.extend((0, 0))")
+        elif ch == '\\':
+            if len(pending) >= 2:
+                pending[-1], pending[-2] = pending[-2], pending[-1]
+            else:
+                flush()
+                code.append("a = pop() if st else 0")
+                code.append("b = pop() if st else 0")
+                code.append("st.extend((a, b))")
+        elif ch == '$':
+            if pending:
+                pending.pop()
+            else:
+                code.append("if st: pop()")
+        elif ch == '.':
+            if pending:
+                code.append(f"out.extend({b'%d ' % pending.pop()!r})")
+            else:
+                code.append("out.extend(b'%d ' % (pop() if st else 0))")
+        elif ch == ',':
+            if pending:
+                code.append(f"out.append({pending.pop() & 0xFF})")
+            else:
+                code.append("out.append((pop() if st else 0) & 0xFF)")
+        elif ch == 'g':
+            if len(pending) >= 2:
+                y_, x_ = pending.pop() % H, pending.pop() % W
+                flush()
+                code.append(f"push(grid[{y_}][{x_}]{masked})")
+            else:
+                flush()
+                code.append("a = pop() if st else 0")
+                code.append("b = pop() if st else 0")
+                code.append(f"push(grid[a % {H}][b % {W}]{masked})")
+        elif ch == '"':
+            string_mode = True
+        elif ch in MOVES:
+            dx, dy = MOVES[ch]
+        elif ch == '#':
+            x = (x + dx) % W
+            y = (y + dy) % H
+        x = (x + dx) % W
+        y = (y + dy) % H
+    flush()
+
+    run = None
+    if code:
+        src = "def run(st, out, grid):\n    pop = st.pop\n    push = st.append\n"
+        src += "".join(f"    {line}\n" for line in code)
+        env = {'MASK': MASK}
+        exec(src, env)
+        run = env['run']
+    return Block(run, steps, frozenset(cells), kind, x, y, dx, dy, string_mode)
+
+
+class Program:
+    """Compiled blocks of one grid in one variant, shared by every VM starting from it."""
+
+    def __init__(self, bounded: bool, terminators: frozenset, max_block: int):
+        self.bounded = bounded
+        self.terminators = terminators
+        self.max_block = max_block
+        self.blocks: dict[tuple, Block] = {}
+        self.index: dict[tuple[int, int], set[tuple]] = {}   # cell -> block keys
+
+
+def index_block(index: dict[tuple[int, int], set[tuple]], key: tuple, block: Block):
+    for cell in block.cells:
+        index.setdefault(cell, set()).add(key)
+
+
+programs: OrderedDict[tuple, Program] = OrderedDict()
+
+
+def program_for(grid: list[list[int]], bounded: bool = True, terminators: frozenset = TERMINATORS,
+                max_block: int = MAX_BLOCK) -> Program:
+    """Return the cached Program of the grid content, creating it if needed."""
+    key = (tuple(map(tuple, grid)), bounded, terminators, max_block)
+    prog = programs.get(key)
+    if prog is None:
+        prog = programs[key] = Program(bounded, terminators, max_block)
+        if len(programs) > PROGRAM_CACHE_SIZE:
+            programs.popitem(last=False)
+    else:
+        programs.move_to_end(key)
+    return prog
+
+
+def read_int(input_data: bytes, inp_i: int) -> tuple[int, int]:
+    """Parse an optionally signed integer after whitespace, as '&' does."""
+    j = inp_i
+    while j < len(input_data) and input_data[j] in b' \t\r\n':
+        j += 1
+    sign = 1
+    if j < len(input_data) and input_data[j:j+1] == b'-':
+        sign = -1
+        j += 1
+    k = j
+    while k < len(input_data) and input_data[k:k+1].isdigit():
+        k += 1
+    if k == j:
+        return 0, k
+    return int(input_data[j:k]) * sign, k
+
+
+class VM:
+    """
+    Befunge-93 machine running a grid (modified in place by 'p').
+
+    Hooks, all optional, are called at the dispatched instructions:
+      on_branch(kind, (x, y), value) at '_' and '|' with the popped value, and
+          at '?' with None; returning a direction (dx, dy) overrides the move
+      on_input(kind, (x, y)) at '&' and '~'; returning a value pushes it
+          instead of reading the input
+      on_put((x, y), old, new) after 'p' wrote a cell
+      on_output(data) after '.' or ',' appended data to the output
+      on_step((x, y), instr, stack) before every instruction (single-steps)
+    Without on_output and on_step the VM runs whole compiled blocks between
+    two hook points, so the hooks add no per-instruction cost.
+
+    A VM paused by stop_on_need_input can be forked into independent VMs,
+    each resumed with its own input; rows of the grid are copied on write.
+    """
+
+    def __init__(self, grid: list[list[int]], input_data: bytes = b'', stop_on_need_input: bool = False,
+                 bounded: bool = True, on_branch=None, on_input=None, on_put=None, on_output=None,
+                 on_step=None):
+        self.grid = grid
+        self.input_data = input_data
+        self.stop_on_need_input = stop_on_need_input
+        self.bounded = bounded
+        self.on_branch = on_branch
+        self.on_input = on_input
+        self.on_put = on_put
+        self.on_output = on_output
+        self.on_step = on_step
+        self.x, self.y, self.dx, self.dy = 0, 0, 1, 0
+        self.string_mode = False
+        self.stack: list[int] = []
+        self.out = bytearray()
+        self.inp_i = 0
+        self.read_char_count = 0
+        self.steps = 0
+        self.status = RunStatus.OK
+        self.program = program_for(grid, bounded,
+                                   TERMINATORS | OUTPUTS if on_output is not None else TERMINATORS,
+                                   1 if on_step is not None else MAX_BLOCK)
+        self.blocks = self.program.blocks
+        self.own_index: dict[tuple[int, int], set[tuple]] | None = None   # set once blocks is private
+        self.dirty: set[tuple[int, int]] = set()
+        self.owned: set[int] | None = None   # rows this VM may write, None for all
+
+    def run(self, max_steps: int = MAX_STEPS) -> str:
+        """
+        Run until '@', a missing input (with stop_on_need_input) or a total
+        of max_steps instructions, and return the status.
+
+        A 'p' that changes the instruction of a cell drops the blocks
+        compiled through that cell from this VM's view of the cache; blocks
+        compiled from modified cells are never shared with other VMs.
+        """
+        grid = self.grid
+        H, W = len(grid), len(grid[0])
+        prog = self.program
+        blocks, own_index, dirty, owned = self.blocks, self.own_index, self.dirty, self.owned
+        stack, out = self.stack, self.out
+        pop, push = stack.pop, stack.append
+        data, inp_i, read_char_count = self.input_data, self.inp_i, self.read_char_count
+        x, y, dx, dy, string_mode = self.x, self.y, self.dx, self.dy, self.string_mode
+        steps = self.steps
+        mask = MASK if self.bounded else -1
+        on_branch, on_input, on_put = self.on_branch, self.on_input, self.on_put
+        on_output, on_step = self.on_output, self.on_step
+        status = RunStatus.OK
+        try:
+            while True:
+                key = (x, y, dx, dy, string_mode)
+                blk = blocks.get(key)
+                if blk is None:
+                    blk = compile_block(grid, x, y, dx, dy, string_mode,
+                                        prog.bounded, prog.terminators, prog.max_block)
+                    blocks[key] = blk
+                    if own_index is not None:
+                        index_block(own_index, key, blk)
+                    if dirty.isdisjoint(blk.cells):
+                        prog.blocks[key] = blk
+                        index_block(prog.index, key, blk)
+                if steps + blk.steps > max_steps:
+                    if steps >= max_steps:
+                        status = RunStatus.LIMIT
+                        break
+                    blk = compile_block(grid, x, y, dx, dy, string_mode,
+                                        prog.bounded, prog.terminators, max_steps - steps)
+                if on_step is not None:
+                    on_step((x, y), grid[y][x], stack)
+                steps += blk.steps
+                if blk.run is not None:
+                    blk.run(stack, out, grid)
+                x, y, dx, dy = blk.x, blk.y, blk.dx, blk.dy
+                kind = blk.kind
+                if kind is None:
+                    string_mode = blk.string_mode
+                    continue
+                string_mode = False
+                if kind == '_' or kind == '|':
+                    a = pop() if stack else 0
+                    if kind == '_':
+                        dx, dy = (-1, 0) if a else (1, 0)
+                    else:
+                        dx, dy = (0, -1) if a else (0, 1)
+                    if on_branch is not None:
+                        d = on_branch(kind, (x, y), a)
+                        if d is not None:
+                            dx, dy = d
+                elif kind == '?':
+                    d = on_branch(kind, (x, y), None) if on_branch is not None else None
+                    dx, dy = d if d is not None else random.choice(DIRECTIONS)
+                elif kind == 'p':
+                    y_ = (pop() if stack else 0) % H
+                    x_ = (pop() if stack else 0) % W
+                    v = (pop() if stack else 0) & 0xFF
+                    if owned is not None and y_ not in owned:
+                        grid[y_] = grid[y_][:]
+                        owned.add(y_)
+                    old = grid[y_][x_]
+                    grid[y_][x_] = v
+                    if (old if old != 0xFF else 32) != (v if v != 0xFF else 32):
+                        cell = (x_, y_)
+                        dirty.add(cell)
+                        if own_index is None:
+                            blocks = dict(blocks)
+                            own_index = {}
+                        for k in prog.index.get(cell, ()):
+                            blocks.pop(k, None)
+                        for k in own_index.get(cell, ()):
+                            blocks.pop(k, None)
+                    if on_put is not None:
+                        on_put((x_, y_), old, v)
+                elif kind == '&' or kind == '~':
+                    val = on_input(kind, (x, y)) if on_input is not None else None
+                    if val is not None:
+                        push(val & mask)
+                    elif inp_i >= len(data):
+                        if self.stop_on_need_input:
+                            # Not executed: a later run retries this cell
+                            steps -= 1
+                            status = RunStatus.NEED_INPUT
+                            break
+                        push(0)
+                    elif kind == '&':
+                        val, inp_i = read_int(data, inp_i)
+                        push(val & mask)
+                    else:
+                        push(data[inp_i])
+                        inp_i += 1
+                    if kind == '~':
+                        read_char_count += 1
+                elif kind == '.' or kind == ',':
+                    a = pop() if stack else 0
+                    chunk = b'%d ' % a if kind == '.' else bytes((a & 0xFF,))
+                    out += chunk
+                    on_output(chunk)
+                else:
+                    status = RunStatus.HALTED
+                    break
+                x = (x + dx) % W
+                y = (y + dy) % H
+        finally:
+            self.blocks, self.own_index = blocks, own_index
+            self.inp_i, self.read_char_count = inp_i, read_char_count
+            self.x, self.y, self.dx, self.dy, self.string_mode = x, y, dx, dy, string_mode
+            self.steps = steps
+            self.status = status
+        return status
+
+    def fork(self, input_data: bytes | None = None, stop_on_need_input: bool | None = None,
+             on_branch=None, on_input=None, on_put=None) -> 'VM':
+        """
+        Return a copy of the VM that runs on independently, with the input
+        replaced by input_data and the given hooks replaced.
+
+        The input read so far must be a prefix of input_data, and the reads
+        must not have depended on where the old input ended (an '&' number
+        cut by the end of the input would read on into the new one).
+        """
+        vm = VM.__new__(VM)
+        vm.__dict__.update(self.__dict__)
+        # Rows are shared until either VM writes them
+        vm.grid = list(self.grid)
+        self.owned = set()
+        vm.owned = set()
+        vm.stack = list(self.stack)
+        vm.out = bytearray(self.out)
+        vm.dirty = set(self.dirty)
+        if self.own_index is not None:
+            vm.blocks = dict(self.blocks)
+            vm.own_index = {cell: set(keys) for cell, keys in self.own_index.items()}
+        if input_data is not None:
+            vm.input_data = input_data
+        if stop_on_need_input is not None:
+            vm.stop_on_need_input = stop_on_need_input
+        if on_branch is not None:
+            vm.on_branch = on_branch
+        if on_input is not None:
+            vm.on_input = on_input
+        if on_put is not None:
+            vm.on_put = on_put
+        return vm
+
+    def result(self):
+        """The result tuple of run_befunge."""
+        return (bytes(self.out), self.status, self.inp_i, (self.x, self.y), list(self.stack),
+                self.read_char_count, self.grid)
+
+
+def trace_step(pos: tuple[int, int], instr: int, stack: list[int]):
+    if instr == 0xFF:
+        instr = ord(' ')
+    sys.stderr.write(f"({pos[0]:02},{pos[1]:02}) '{chr(instr)}' stk={stack[-8:]}\n")
+
+
+def run_befunge(grid: list[list[int]], input_data: bytes, trace: bool = False, stop_on_need_input: bool = False):
+    vm = VM(grid, input_data, stop_on_need_input, on_step=trace_step if trace else None)
+    if vm.run() == RunStatus.LIMIT:
+        raise RuntimeError("Too many steps; possible infinite loop")
+    return vm.result()
+
+
+class Gates:
+    """
+    on_branch hook of the gate analysis: records the branch events except
+    those of the '_' in ignore (the ones printing strings), '?' goes right.
+    """
+
+    def __init__(self, ignore: set[tuple[int, int]] | frozenset = frozenset(), events: list | None = None):
+        self.ignore = ignore
+        self.events: list[tuple[str, tuple[int, int], int]] = [] if events is None else events
+
+    def __call__(self, kind: str, pos: tuple[int, int], value: int | None):
+        if kind == '?':
+            return (1, 0)
+        if kind == '|' or pos not in self.ignore:
+            self.events.append((kind, pos, value))
+
+
+def read_zero(kind: str, pos: tuple[int, int]) -> int | None:
+    """on_input hook of the gate analysis: '&' reads 0."""
+    return 0 if kind == '&' else None
+
+
+SNAPSHOT_CACHE_SIZE = 16
+snapshots: OrderedDict[tuple, VM] = OrderedDict()
+
+
+def gate_snapshot(grid: list[list[int]], prefix: bytes, max_steps: int = 1_000_000,
+                  ignore: set[tuple[int, int]] | frozenset = frozenset()) -> VM:
+    """
+    Return the cached gate analysis VM of the grid paused where it needs
+    input past prefix (or stopped before), to fork the runs of all inputs
+    starting with prefix from.
+    """
+    ignore = frozenset(ignore)
+    key = (tuple(map(tuple, grid)), prefix, max_steps, ignore)
+    vm = snapshots.get(key)
+    if vm is None:
+        vm = VM([row[:] for row in grid], prefix, True, bounded=False, on_branch=Gates(ignore),
+                on_input=read_zero)
+        vm.run(max_steps)
+        snapshots[key] = vm
+        if len(snapshots) > SNAPSHOT_CACHE_SIZE:
+            snapshots.popitem(last=False)
+    else:
+        snapshots.move_to_end(key)
+    return vm
+
+
+def gate_events(grid: list[list[int]], input_data: bytes, max_steps: int = 1_000_000,
+                ignore: set[tuple[int, int]] | frozenset = frozenset(),
+                prefix: bytes = b'') -> list[tuple[str, tuple[int, int], int]]:
+    """
+    Run a copy of the grid in the unbounded dialect, with '?' going right and
+    '&' reading 0, for at most max_steps instructions. Return the
+    ('_' or '|', (x, y), popped value) events of the branches, except the
+    '_' in ignore.
+
+    Inputs sharing a prefix resume a fork of the run paused after it
+    instead of executing it again.
+    """
+    if prefix and input_data.startswith(prefix):
+        snap = gate_snapshot(grid, prefix, max_steps, ignore)
+        vm = snap.fork(input_data, False, on_branch=Gates(snap.on_branch.ignore, list(snap.on_branch.events)))
+        if vm.status != RunStatus.HALTED:
+            vm.run(max_steps)
+    else:
+        vm = VM([row[:] for row in grid], input_data, bounded=False, on_branch=Gates(ignore),
+                on_input=read_zero)
+        vm.run(max_steps)
+    return vm.on_branch.events
+
+
+def benchmark(grid: list[list[int]], input_data: bytes, repeat: int = 5):
+    """Print the steps/sec of the stepwise reference and the VM on one run."""
+    vm = VM([row[:] for row in grid], input_data)
+    vm.run()
+    steps = vm.steps
+    programs.clear()
+    for name, fn in (('stepwise', lambda g: run_befunge_stepwise(g, input_data)),
+                     ('compiled (cold)', lambda g: (programs.clear(), run_befunge(g, input_data))),
+                     ('compiled', lambda g: run_befunge(g, input_data))):
+        best = float('inf')
+        for _ in range(repeat):
+            g = [row[:] for row in grid]
+            t = time.perf_counter()
+            fn(g)
+            best = min(best, time.perf_counter() - t)
+        print(f"{name:<16} {steps:>9} steps  {best*1e3:9.2f} ms  {steps/best/1e6:7.2f} Msteps/s")
+
+
 def main():
     import argparse
     ap = argparse.ArgumentParser()
     ap.add_argument('program', help='Befunge program file (80x25)')
     ap.add_argument('-i', '--input', help='Input string', default='')
     ap.add_argument('--trace', action='store_true')
+    ap.add_argument('--bench', action='store_true', help='compare the steps/sec of both engines')
     args = ap.parse_args()
 
     grid = load_program(args.program)
-    out, status, _, _, _ = run_befunge(grid, args.input.encode('latin1'), trace=args.trace)
+    if args.bench:
+        benchmark(grid, args.input.encode('latin1'))
+        return
+    out, *_ = run_befunge(grid, args.input.encode('latin1'), trace=args.trace)
     sys.stdout.buffer.write(out)
 
 
@@ -1,4 +1,4 @@
-from befunge_runner import load_program_from_binary, run_befunge, load_program
+from befunge_runner import load_program_from_binary, run_befunge, load_program, gate_events
 import json
 import os
 
@@ -28,115 +28,7 @@ def resolve_grid(program_file: str | None = None,
 
 
 def event_seq(mid: bytes, max_steps: int = 600000, grid_in: list[list[int]] | None = None):
-    pre = b'bctf{'
-    s = pre + mid + b'}\n'
-    grid = [row[:] for row in (grid_in if grid_in is not None else prog)]
-    H, W = len(grid), len(grid[0])
-    x = y = 0
-    dx, dy = 1, 0
-    stack = []
-    string_mode = False
-    inp = list(s)
-    seq = []
-    for _ in range(max_steps):
-        instr = grid[y][x]
-        if instr == 0xFF:
-            instr = 32
-        ch = chr(instr)
-        if string_mode:
-            if ch == '"':
-                string_mode = False
-            else:
-                stack.append(instr)
-        else:
-            if ch == ' ':
-                pass
-            elif '0' <= ch <= '9':
-                stack.append(ord(ch) - 48)
-            elif ch == '+':
-                b = stack.pop() if stack else 0
-                a = stack.pop() if stack else 0
-                stack.append(a + b)
-            elif ch == '-':
-                b = stack.pop() if stack else 0
-                a = stack.pop() if stack else 0
-                stack.append(a - b)
-            elif ch == '*':
-                b = stack.pop() if stack else 0
-                a = stack.pop() if stack else 0
-                stack.append(a * b)
-            elif ch == '/':
-                b = stack.pop() if stack else 0
-                a = stack.pop() if stack else 0
-                stack.append(0 if b == 0 else a // b)
-            elif ch == '%':
-                b = stack.pop() if stack else 0
-                a = stack.pop() if stack else 0
-                stack.append(0 if b == 0 else a % b)
-            elif ch == '!':
-                a = stack.pop() if stack else 0
-                stack.append(0 if a else 1)
-            elif ch == '`':
-                b = stack.pop() if stack else 0
-                a = stack.pop() if stack else 0
-                stack.append(1 if a > b else 0)
-            elif ch == '>':
-                dx, dy = 1, 0
-            elif ch == '<':
-                dx, dy = -1, 0
-            elif ch == '^':
-                dx, dy = 0, -1
-            elif ch == 'v':
-                dx, dy = 0, 1
-            elif ch == '?':
-                dx, dy = 1, 0
-            elif ch == '_':
-                a = stack.pop() if stack else 0
-                if (x, y) not in PRINT_U_SPOTS:
-                    seq.append(('_', (x, y), a))
-                dx, dy = (1, 0) if a == 0 else (-1, 0)
-            elif ch == '|':
-                a = stack.pop() if stack else 0
-                seq.append(('|', (x, y), a))
-                dx, dy = (0, 1) if a == 0 else (0, -1)
-            elif ch == '"':
-                string_mode = True
-            elif ch == ':':
-                a = stack.pop() if stack else 0
-                stack.append(a)
-                stack.append(a)
-            elif ch == '\\':
-                a = stack.pop() if stack else 0
-                b = stack.pop() if stack else 0
-                stack.append(a)
-                stack.append(b)
-            elif ch == '$':
-                _ = stack.pop() if stack else 0
-            elif ch == '.':
-                a = stack.pop() if stack else 0
-            elif ch == ',':
-                a = stack.pop() if stack else 0
-            elif ch == '#':
-                x = (x + dx) % W
-                y = (y + dy) % H
-            elif ch == 'p':
-                y_ = stack.pop() if stack else 0
-                x_ = stack.pop() if stack else 0
-                v = stack.pop() if stack else 0
-                grid[y_ % H][x_ % W] = v & 0xFF
-            elif ch == 'g':
-                y_ = stack.pop() if stack else 0
-                x_ = stack.pop() if stack else 0
-                stack.append(grid[y_ % H][x_ % W])
-            elif ch == '&':
-                stack.append(0)
-            elif ch == '~':
-                stack.append(inp.pop(0) if inp else 0)
-            elif ch == '@':
-                break
-        x = (x + dx) % W
-        y = (y + dy) % H
-    return seq
+    return gate_events((grid_in if grid_in is not None else prog), b'bctf{' + mid + b'}\n', max_steps, PRINT_U_SPOTS, b'bctf{')
 
 
 def first_diff(a, b):
@@ -0,0 +1,163 @@
+"""
+Versioned binary format for the NTRUSign keys and signatures.
+
+Every record starts with a fixed little-endian header holding a magic
+string, the format version and the byte width of the coefficients.
+Key records go on with the parameters (N, B, q, df, dg) and the name and
+email of the owner, signature records with N and the nonce r. The
+coefficient arrays follow, packed as little-endian signed integers and
+aligned on 8 bytes, so they are read back with np.frombuffer. The arrays
+read are copies unless copy=False is given: 8-byte coefficients are then
+read-only views of the mmap or bytes object, the other widths are still
+converted to int64.
+
+armor/dearmor wrap a record in base64 between BEGIN/END lines.
+"""
+
+import base64
+import mmap
+import struct
+import numpy as np
+
+VERSION = 1
+MAGIC_PUB = b"NTRP"
+MAGIC_PRIV = b"NTRK"
+MAGIC_SIG = b"NTRS"
+
+# magic, version, width, reserved, N, B, q, df, dg, name and email lengths
+KEY_HEADER = struct.Struct("<4sBBHIIIIIHH")
+# magic, version, width, reserved, N, r
+SIG_HEADER = struct.Struct("<4sBBHIQ")
+ALIGN = 8
+WIDTHS = (1, 2, 4, 8)
+
+
+def coeff_width(arrays):
+    """
+    Return the smallest width in bytes holding every coefficient of the
+    given arrays as a signed integer
+    """
+    low = min(int(np.min(a)) for a in arrays)
+    high = max(int(np.max(a)) for a in arrays)
+    for w in WIDTHS:
+        if -2**(8*w - 1) <= low and high < 2**(8*w - 1):
+            return w
+    raise Exception("Coefficients too large for the binary format")
+
+
+def padding(n):
+    """
+    Number of bytes to add after n bytes to reach the alignment
+    """
+    return -n % ALIGN
+
+
+def pack_arrays(arrays, width):
+    """
+    Pack the coefficient arrays with the given width in bytes
+    """
+    return np.stack(arrays).astype(f"<i{width}").tobytes()
+
+
+def unpack_arrays(data, offset, count, N, width, copy=True):
+    """
+    Return count coefficient arrays of length N stored in data at offset,
+    as rows of a writable int64 array. With copy=False the rows are a
+    read-only view of data when width is 8.
+    """
+    if width not in WIDTHS:
+        raise Exception(f"Invalid coefficient width {width}")
+    c = np.frombuffer(data, dtype=f"<i{width}", count=count*N, offset=offset)
+    return c.astype(np.int64, copy=copy).reshape(count, N)
+
+
+def check(magic, version, expected):
+    """
+    Raise an exception if the header is not the one of the expected record
+    """
+    if magic != expected:
+        raise Exception(f"Invalid magic {magic!r}, expected {expected!r}")
+    if version != VERSION:
+        raise Exception(f"Unsupported format version {version}")
+
+
+def encode_key(magic, params, name, email, arrays, width=None):
+    """
+    Build a key record. params is (N, B, q, df, dg), arrays the list of
+    key polynomials coefficients.
+    """
+    if width is None:
+        width = coeff_width(arrays)
+    name = name.encode("utf-8")
+    email = email.encode("utf-8")
+    head = KEY_HEADER.pack(magic, VERSION, width, 0, *params, len(name), len(email))
+    head += name + email
+    head += bytes(padding(len(head)))
+    return head + pack_arrays(arrays, width)
+
+
+def decode_key(data, magic, copy=True):
+    """
+    Parse a key record, return (params, name, email, arrays) with arrays
+    an int64 array with one row per polynomial
+    """
+    (m, version, width, _, N, B, q, df, dg, ln, le) = KEY_HEADER.unpack_from(data, 0)
+    check(m, version, magic)
+    offset = KEY_HEADER.size
+    name = bytes(data[offset:offset+ln]).decode("utf-8")
+    email = bytes(data[offset+ln:offset+ln+le]).decode("utf-8")
+    offset += ln + le
+    offset += padding(offset)
+    count = 1 if magic == MAGIC_PUB else 3 * (B + 1)
+    arrays = unpack_arrays(data, offset, count, N, width, copy)
+    return ((N, B, q, df, dg), name, email, arrays)
+
+
+def encode_signature(r, coeff, width=None):
+    """
+    Build a signature record for the nonce r and the coefficients of s
+    """
+    if width is None:
+        width = coeff_width([coeff])
+    if not 0 <= r < 2**64:
+        raise Exception(f"Nonce {r} too large for the binary format")
+    head = SIG_HEADER.pack(MAGIC_SIG, VERSION, width, 0, len(coeff), r)
+    head += bytes(padding(len(head)))
+    return head + pack_arrays([coeff], width)
+
+
+def decode_signature(data, copy=True):
+    """
+    Parse a signature record, return (r, coeff)
+    """
+    (m, version, width, _, N, r) = SIG_HEADER.unpack_from(data, 0)
+    check(m, version, MAGIC_SIG)
+    offset = SIG_HEADER.size + padding(SIG_HEADER.size)
+    return (r, unpack_arrays(data, offset, 1, N, width, copy)[0])
+
+
+def armor(data, label):
+    """
+    Wrap a binary record in base64 between BEGIN/END lines
+    """
+    body = base64.encodebytes(bytes(data)).decode("ascii")
+    return f"-----BEGIN NTRU {label}-----\n{body}-----END NTRU {label}-----\n"
+
+
+def dearmor(s):
+    """
+    Return the binary record wrapped in s by armor
+    """
+    lines = s.strip().splitlines()
+    if not lines[0].startswith("-----BEGIN") or not lines[-1].startswith("-----END"):
+        raise Exception("Invalid armored record")
+    return base64.b64decode("".join(lines[1:-1]))
+
+
+def map_file(path):
+    """
+    Memory-map the file at path read-only, the result can be passed to
+    the binary import functions
+    """
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,295 @@
+"""
+Inversion in (Z/qZ)[X]/(X^N-1) for q a power of a prime.
+
+The inverse modulo the prime is computed with the almost inverse algorithm
+from "Almost Inverses and Fast NTRU Key Creation" by Joseph H. SILVERMAN.
+Modulo 2 and 3 the polynomials are packed in the bits of Python integers,
+for the other primes they are NumPy arrays. The inverse is then lifted to the prime
+power with Newton iterations b = b*(2-a*b).
+
+The highest power of the prime reached for the last polynomials is
+cached, so inverting the same polynomial modulo another power of the
+prime (e.g. another q during key generation) only lifts or reduces it.
+The entries are found by the residues modulo the prime, and reused up to
+the power modulo which the polynomials are still congruent.
+"""
+
+from collections import OrderedDict
+import threading
+import numpy as np
+from NTRUSign.NTT import cyclic_convolve
+from NTRUSign.Sparse import SparseTernary, is_ternary
+
+# Number of polynomials whose inverse is kept
+CACHE_SIZE = 64
+# (prime, N, coefficients modulo the prime) -> (m, coefficients modulo m,
+# inverse modulo m) for the highest power m of the prime computed
+cache = OrderedDict()
+cache_lock = threading.Lock()
+
+
+def prime_power(p):
+    """
+    Return (q, r) with q prime and p = q^r,
+    raise an exception if p is not a power of a prime
+    """
+    if p < 2:
+        raise Exception(f'{p} is not a power of a prime')
+    q = 2
+    while q * q <= p and p % q != 0:
+        q += 1
+    if p % q != 0:
+        # No factor below sqrt(p), p is prime
+        return (p, 1)
+    (m, r) = (p, 0)
+    while m % q == 0:
+        m //= q
+        r += 1
+    if m != 1:
+        raise Exception(f'{p} is not a power of a prime')
+    return (q, r)
+
+
+def pack(mask):
+    """
+    Pack a boolean array in a Python integer, bit i being mask[i]
+    """
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def unpack(x, N):
+    """
+    Unpack the N low bits of the Python integer x in an int64 array
+    """
+    bits = np.frombuffer(x.to_bytes((N + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(bits, bitorder='little')[:N].astype(np.int64)
+
+
+def rotate(x, shift, N):
+    """
+    Multiply the packed polynomial x of degree < N by X^shift mod X^N-1
+    """
+    shift %= N
+    return ((x << shift) | (x >> (N - shift))) & ((1 << N) - 1)
+
+
+def inverse_mod2(coeff, N):
+    """
+    Inverse of the coefficient array modulo (2, X^N-1)
+    Polynomials are packed in Python integers, bit i being the
+    coefficient of X^i.
+    """
+    f = pack(np.asarray(coeff[:N]) % 2 != 0)
+    g = (1 << N) | 1
+    (b, c, k) = (1, 0, 0)
+    if f == 0:
+        raise Exception("Inversion Fails")
+    while True:
+        # Divide f by the highest power of X dividing it
+        tz = (f & -f).bit_length() - 1
+        f >>= tz
+        c <<= tz
+        k += tz
+        if f == 1:
+            break
+        if f.bit_length() < g.bit_length():
+            (f, g, b, c) = (g, f, c, b)
+        f ^= g
+        b ^= c
+        if f == 0:
+            raise Exception("Inversion Fails")
+
+    # Reduce b mod X^N-1 and multiply it by X^-k
+    mask = (1 << N) - 1
+    while b >> N:
+        b = (b & mask) ^ (b >> N)
+    return unpack(rotate(b, -k, N), N)
+
+
+def add3(a, b):
+    """
+    Sum of two polynomials over GF(3) packed as pairs (x1, x2) of integers,
+    the bit i of x1 (resp. x2) being set when the coefficient of X^i is 1
+    (resp. 2)
+    """
+    (a1, a2) = a
+    (b1, b2) = b
+    zero_a = ~(a1 | a2)
+    zero_b = ~(b1 | b2)
+    return ((a1 & zero_b) | (zero_a & b1) | (a2 & b2),
+            (a2 & zero_b) | (zero_a & b2) | (a1 & b1))
+
+
+def inverse_mod3(coeff, N):
+    """
+    Inverse of the coefficient array modulo (3, X^N-1)
+    Polynomials are packed in pairs of Python integers, see add3.
+    """
+    c3 = np.asarray(coeff[:N]) % 3
+    f = (pack(c3 == 1), pack(c3 == 2))
+    g = (1 << N, 1)
+    (b, c, k) = ((1, 0), (0, 0), 0)
+    if f == (0, 0):
+        raise Exception("Inversion Fails")
+    while True:
+        # Divide f by the highest power of X dividing it
+        nz = f[0] | f[1]
+        tz = (nz & -nz).bit_length() - 1
+        f = (f[0] >> tz, f[1] >> tz)
+        c = (c[0] << tz, c[1] << tz)
+        k += tz
+        if (f[0] | f[1]) == 1:
+            break
+        if (f[0] | f[1]).bit_length() < (g[0] | g[1]).bit_length():
+            (f, g, b, c) = (g, f, c, b)
+        if (f[0] & 1) == (g[0] & 1):
+            # Same constant coefficient, f = f - g
+            f = add3(f, (g[1], g[0]))
+            b = add3(b, (c[1], c[0]))
+        else:
+            f = add3(f, g)
+            b = add3(b, c)
+        if f == (0, 0):
+            raise Exception("Inversion Fails")
+
+    if f[1] == 1:
+        # f = 2 = -1
+        b = (b[1], b[0])
+    # Reduce b mod X^N-1 and multiply it by X^-k
+    mask = (1 << N) - 1
+    while (b[0] | b[1]) >> N:
+        b = add3((b[0] & mask, b[1] & mask), (b[0] >> N, b[1] >> N))
+    return unpack(rotate(b[0], -k, N), N) + 2 * unpack(rotate(b[1], -k, N), N)
+
+
+def inverse_mod_prime(coeff, N, p):
+    """
+    Inverse of the coefficient array modulo (p, X^N-1) with p prime
+    """
+    f = np.zeros(N + 1, dtype=np.int64)
+    f[:N] = np.asarray(coeff[:N]) % p
+    g = np.zeros(N + 1, dtype=np.int64)
+    g[0] = p - 1
+    g[N] = 1
+    b = np.zeros(N, dtype=np.int64)
+    b[0] = 1
+    c = np.zeros(N, dtype=np.int64)
+    (k, df, dg) = (0, N, N)
+    while True:
+        nonzero = np.flatnonzero(f[:df + 1])
+        if len(nonzero) == 0:
+            raise Exception("Inversion Fails")
+        (tz, df) = (nonzero[0], nonzero[-1])
+        if tz > 0:
+            # Divide f by X^tz, b and c are kept modulo X^N-1
+            f[:df + 1 - tz] = f[tz:df + 1]
+            f[df + 1 - tz:df + 1] = 0
+            df -= tz
+            c = np.roll(c, tz)
+            k += tz
+        if df == 0:
+            break
+        if df < dg:
+            (f, g, b, c, df, dg) = (g, f, c, b, dg, df)
+        u = f[0] * pow(int(g[0]), -1, p) % p
+        f[:dg + 1] = (f[:dg + 1] - u * g[:dg + 1]) % p
+        b = (b - u * c) % p
+
+    b = b * pow(int(f[0]), -1, p) % p
+    return np.roll(b, -k)
+
+
+def newton_lift(a, b, N, q, p):
+    """
+    Lift b, inverse of a modulo (q, X^N-1), to the inverse of a modulo
+    (p, X^N-1) where q divides p, both powers of the same prime.
+    """
+    m = q
+    while m < p:
+        m = min(m * m, p)
+        ab = cyclic_convolve(a, b, N) % m
+        ab = -ab
+        ab[0] += 2
+        b = cyclic_convolve(b, ab, N) % m
+    return b
+
+
+def cache_key(coeff, N, q):
+    """
+    Return the cache key of the coefficient array modulo the prime q.
+    Polynomials sharing a key have the same inverse modulo q only, the
+    entry records the coefficients to compare modulo higher powers.
+    """
+    residues = (np.asarray(coeff) % q).astype(np.int64)
+    return (q, N, residues.tobytes())
+
+
+def congruence(a, c, q, m):
+    """
+    Return the highest power of the prime q dividing m modulo which the
+    coefficient arrays a and c are congruent (at least q)
+    """
+    d = np.asarray(a) - np.asarray(c)
+    while m > q and (d % m).any():
+        m //= q
+    return m
+
+
+def cached(key):
+    """
+    Return the cached (m, a, b) for key, None if there is none
+    """
+    with cache_lock:
+        entry = cache.get(key)
+        if entry is not None:
+            cache.move_to_end(key)
+        return entry
+
+
+def remember(key, m, a, b):
+    """
+    Cache b, inverse of a modulo m, unless a higher power is already
+    known for the same polynomial
+    """
+    with cache_lock:
+        entry = cache.get(key)
+        if entry is None or entry[0] < m or congruence(entry[1], a, key[0], m) < m:
+            cache[key] = (m, np.asarray(a) % m, b)
+        cache.move_to_end(key)
+        while len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def inverse(coeff, p):
+    """
+    Inverse of the coefficient array modulo (p, X^N-1)
+    with p a power of a prime and N the length of coeff
+    """
+    N = len(coeff)
+    (q, r) = prime_power(p)
+    key = cache_key(coeff, N, q)
+    entry = cached(key)
+    if entry is not None:
+        # The cached inverse holds modulo the power of q up to which the
+        # polynomials agree, at least q since they share the key
+        m = congruence(entry[1], coeff, q, min(entry[0], p))
+        b = entry[2] % m
+        if m >= p:
+            return b
+    else:
+        if q == 2:
+            b = inverse_mod2(coeff, N)
+        elif q == 3:
+            b = inverse_mod3(coeff, N)
+        else:
+            b = inverse_mod_prime(coeff, N, q)
+        m = q
+    if m < p:
+        a = np.asarray(coeff)
+        if is_ternary(a):
+            # Key polynomials, every lifting step reuses the same operand
+            a = SparseTernary(a)
+        b = newton_lift(a, b, N, m, p)
+    remember(key, p, coeff, b)
+    # The caller may modify the result in place
+    return b.copy()
@@ -1,18 +1,52 @@
 import NTRUSign.Polynomial as pn
+from NTRUSign.NTT import Transformed
+from NTRUSign.Sparse import SparseTernary, is_ternary
+from NTRUSign import Binary
+from NTRUSign import Metrics
+from NTRUSign import Random
 import numpy as np
-from multiprocessing import Pool, cpu_count
 
 
-def singleWorker(params):
+def key_operand(P):
+    """
+    Return the operand cached for the key polynomial P in the star
+    multiplications: its SparseTernary form for ternary polynomials, its
+    transforms otherwise (also kept by the SparseTernary for the products
+    where the sparse one is slower).
+    """
+    dense = Transformed(P.coeff).precompute()
+    if not is_ternary(P.coeff):
+        return dense
+    sp = SparseTernary(P.coeff)
+    sp.dense = dense
+    return sp
+
+
+def singleWorker(params, cancelled=None, rng=None):
     """
     A single function that can be executed in parallel to accelerate
     Key creation
+    If given, cancelled() is checked before every try and None is
+    returned once it is True.
+    The polynomials are drawn from rng if given (see NTRUSign.Random).
     """
+    if rng is not None:
+        rng = Random.generator(rng)
     N, df, dg, q, t = params
+    if t == 'standard' and N & (N - 1) != 0:
+        # NTRUSolve works in the tower of rings Z[X]/(X^n+1), retrying
+        # would never succeed
+        raise Exception(f"Standard basis needs N a power of two, got {N}")
+    attempts = 0
     while True:
+        if cancelled is not None and cancelled():
+            return None
+        attempts += 1
+        tm = Metrics.timer("keygen")
         try:
-            ft = pn.randomGenPoly(N, df)
-            gt = pn.randomGenPoly(N, dg)
+            ft = pn.randomGenPoly(N, df, rng)
+            gt = pn.randomGenPoly(N, dg, rng)
+            tm.lap("random")
 
             if t == 'transpose':
                 f = ft
@@ -21,11 +55,20 @@ def singleWorker(params):
                 (F, G) = pn.NTRUSolve(N, q, ft, gt)
                 f = ft
                 fp = F
-            h = (f.inv(q).star_multiply_fft(fp)).mod(q)
+                tm.lap("solve")
+            fq = f.inv(q)
+            tm.lap("inverse")
+            h = fq.star_multiply_ntt(fp)
+            h %= q
+            tm.lap("public")
             break
         except Exception as e:
+            tm.lap("failed")
+            Metrics.count("keygen.retries")
             print(f"Exception {e} catched, retrying...")
             pass
+    Metrics.count("keygen.polynomials")
+    Metrics.observe("keygen.attempts_until_success", attempts, Metrics.COUNT_EDGES)
     return (f, fp, h)
 
 
@@ -39,40 +82,35 @@ class KeyPair:
                  t='transpose',
                  gen=False,
                  name="User Name",
-                 email="user@example.com"):
+                 email="user@example.com",
+                 workers=1,
+                 rng=None):
         """
         Create a key with the parameter passed to the constructor
+        With workers > 1 (or None for the default count) the key
+        polynomials are generated by the processes of a persistent pool.
+        With rng (a seed, see NTRUSign.Random) the polynomials of level i
+        are drawn from the i-th stream spawned from it, so the same seed
+        gives the same key whatever the number of workers.
         """
         if gen:
             f = [None for _ in range(B+1)]
             fp = [None for _ in range(B+1)]
             h = [None for _ in range(B+1)]
 
-            # The key generation will be separated between multiple processes.
-            # We try to put 2 process by CPU cores
-            try:
-                nproc = max(2 * cpu_count(), B+1)
-            except NotImplementedError:
-                nproc = B+1
-
-            params = [(N, df, dg, q, t) for _ in range(nproc)]
-            i = 0
-            res = []
-            '''
-            with Pool(nproc) as p:
-                print(f"Launching {nproc} processes")
-                for i in p.imap_unordered(singleWorker, params, chunksize=1):
-                    # Every time a result is received it is put in res
-                    res += [i]
-                    print(f"Got {len(res)} answer(s) out of {B+1}")
-                    if len(res) >= B+1:
-                        # If we have enough results the process are stopped
-                        break
-            '''
-            print("Generating keys")
-            for i in range(B+1):
-                res.append(singleWorker(params[i]))
-
+            # The key generation can be separated between multiple processes.
+            params = (N, df, dg, q, t)
+            rngs = [None] * (B+1) if rng is None else Random.spawn(rng, B+1)
+            res = None
+            if workers is None or workers > 1:
+                from NTRUSign.Parallel import get_pool
+                pool = get_pool(workers)
+                if pool.workers > 1:
+                    print(f"Generating keys with {pool.workers} processes")
+                    res = pool.generate(params, B+1, None if rng is None else rngs)
+            if res is None:
+                print("Generating keys")
+                res = [singleWorker(params, rng=r) for r in rngs]
 
             f = [r[0] for r in res]
             fp = [r[1] for r in res]
@@ -87,6 +125,7 @@ class KeyPair:
             """
             self.pub = None
             self.priv = None
+        self.precompute()
         self.N = N
         self.B = B
         self.q = q
@@ -95,6 +134,31 @@ class KeyPair:
         self.name = name
         self.email = email
 
+    def precompute(self):
+        """
+        Cache the NTT transforms of the key polynomials, and the sparse
+        form of the ternary ones (see key_operand), so that the star
+        multiplications of signing and verifying only transform the
+        message dependent operand, as well as the transforms of the
+        differences of the h_i used by the perturbations.
+        Must be called again if pub or priv are modified by hand.
+        """
+        if self.pub is None:
+            self.pub_ntt = None
+        else:
+            self.pub_ntt = Transformed(self.pub.coeff).precompute()
+        if self.priv is None:
+            self.priv_ntt = None
+            self.level_ntt = None
+        else:
+            self.priv_ntt = tuple([key_operand(P) for P in polys] for polys in self.priv)
+            # Differences h_i - h_(i-1) mapping the perturbation of level i
+            # to the point signed at level i-1
+            h = self.priv[2]
+            self.level_ntt = [None] + [
+                Transformed((h[i] - h[i-1]).coeff).precompute() for i in range(1, len(h))
+            ]
+
     def export_pub(self, printk=True):
         """
         Export the public key in a readable format either by returning it to
@@ -180,6 +244,7 @@ class KeyPair:
 
         self.pub = pn.Polynomial(N=self.N)
         self.pub.coeff = np.array(public_coeff)
+        self.precompute()
 
     def export_priv(self, printk=True):
         """
@@ -296,6 +361,69 @@ class KeyPair:
             cursor += 1
 
         self.q = int(sn)
+        self.precompute()
+
+    def params(self):
+        """
+        Return the parameters (N, B, q, df, dg) of the key
+        """
+        return (self.N, self.B, self.q, self.df, self.dg)
+
+    def set_params(self, params):
+        """
+        Set the parameters (N, B, q, df, dg) of the key
+        """
+        (self.N, self.B, self.q, self.df, self.dg) = params
+
+    def export_pub_bin(self, width=None):
+        """
+        Export the public key in the binary format of NTRUSign.Binary,
+        the coefficients are packed on width bytes (the smallest possible
+        by default).
+        """
+        if self.pub is None:
+            raise Exception("No public key saved, please load or generate a key pair")
+        return Binary.encode_key(Binary.MAGIC_PUB, self.params(), self.name,
+                                 self.email, [self.pub.coeff], width)
+
+    def import_pub_bin(self, data, copy=True):
+        """
+        Import a public key from bytes, or any buffer such as the result of
+        Binary.map_file, previously exported by export_pub_bin.
+        With copy=False the coefficients may be read-only views of data.
+        """
+        (params, self.name, self.email, arrays) = Binary.decode_key(data, Binary.MAGIC_PUB, copy)
+        self.set_params(params)
+        self.pub = pn.Polynomial(N=self.N)
+        self.pub.coeff = arrays[0]
+        self.precompute()
+
+    def export_priv_bin(self, width=None):
+        """
+        Export the private key in the binary format of NTRUSign.Binary,
+        the coefficients are packed on width bytes (the smallest possible
+        by default).
+        """
+        if self.priv is None:
+            raise Exception("No priv key saved, please load or generate a key pair")
+        arrays = [self.priv[j][i].coeff for i in range(self.B+1) for j in range(3)]
+        return Binary.encode_key(Binary.MAGIC_PRIV, self.params(), self.name,
+                                 self.email, arrays, width)
+
+    def import_priv_bin(self, data, copy=True):
+        """
+        Import a private key from bytes, or any buffer such as the result of
+        Binary.map_file, previously exported by export_priv_bin.
+        With copy=False the coefficients may be read-only views of data.
+        """
+        (params, self.name, self.email, arrays) = Binary.decode_key(data, Binary.MAGIC_PRIV, copy)
+        self.set_params(params)
+        self.priv = ([], [], [])
+        for (i, c) in enumerate(arrays):
+            P = pn.Polynomial(N=self.N)
+            P.coeff = c
+            self.priv[i % 3].append(P)
+        self.precompute()
 
 
 if __name__ == "__main__":
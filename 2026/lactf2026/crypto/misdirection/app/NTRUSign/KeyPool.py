@@ -0,0 +1,181 @@
+import NTRUSign.KeyGenerator as KeyGenerator
+import os
+import queue
+import threading
+import time
+
+# delay before retrying after a failure, doubled on every consecutive
+# failure up to RETRY_MAX seconds
+RETRY_DELAY = 1.0
+RETRY_MAX = 60.0
+
+
+class KeyPool:
+    """
+    Pool of key pairs generated ahead of time by a background thread.
+
+    take() returns a ready key at once and wakes the thread up to refill
+    the pool. Keys are persisted in the binary key format in directory
+    (if given), so keys generated before a restart are served first.
+    prepare(k), if given, is run in the background on every key before it
+    is made available, its result is returned by take() with the key.
+    A failure to make a key ready is recorded in status() and retried
+    after a growing delay, take() reports it if no key comes in time.
+    The directory is created and the thread started by the first take()
+    (or start()), stop() ends the thread.
+    """
+
+    def __init__(self, size=2, directory=None, prepare=None, **params):
+        self.size = size
+        self.directory = directory
+        self.prepare = prepare
+        self.params = params
+        self.keys = queue.Queue()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.generated = 0
+        self.serial = 0
+        self.error = None
+        self.failures = 0
+        self.thread = None
+
+    def start(self):
+        """
+        Start the refill thread if it is not running yet
+        """
+        with self.lock:
+            if self.thread is None:
+                self.stopping.clear()
+                self.thread = threading.Thread(target=self.refill, daemon=True)
+                self.thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stop the refill thread and wait at most timeout seconds for it to
+        finish the key in progress. The keys ready are kept.
+        """
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+        if thread is not None:
+            self.stopping.set()
+            self.wakeup.set()
+            thread.join(timeout)
+
+    def stored(self):
+        """
+        Return the paths of the persisted keys not yet loaded in the pool
+        """
+        if self.directory is None:
+            return []
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".key"))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def load(self, path):
+        """
+        Load a key persisted by save
+        """
+        k = KeyGenerator.KeyPair()
+        with open(path, "rb") as f:
+            k.import_priv_bin(f.read())
+        k.pub = k.priv[2][0]
+        k.precompute()
+        return k
+
+    def save(self, k):
+        """
+        Persist the key k in the directory, return its path
+        """
+        self.serial += 1
+        path = os.path.join(self.directory, f"{time.time_ns()}-{self.serial}.key")
+        with open(path + ".tmp", "wb") as f:
+            f.write(k.export_priv_bin())
+        # The key only shows up once it is completely written
+        os.replace(path + ".tmp", path)
+        return path
+
+    def refill(self):
+        """
+        Main loop of the refill thread, keep size keys in the pool
+        """
+        loaded = set()
+        while not self.stopping.is_set():
+            if self.keys.qsize() >= self.size:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            t = time.perf_counter()
+            path = None
+            try:
+                if self.directory is not None:
+                    os.makedirs(self.directory, exist_ok=True)
+                paths = [p for p in self.stored() if p not in loaded]
+                if paths:
+                    path = paths[0]
+                    # a key that fails to load is not tried again
+                    loaded.add(path)
+                    k = self.load(path)
+                else:
+                    k = KeyGenerator.KeyPair(gen=True, **self.params)
+                    path = self.save(k) if self.directory is not None else None
+                    loaded.add(path)
+                extra = self.prepare(k) if self.prepare is not None else None
+            except Exception as e:
+                with self.lock:
+                    self.error = e
+                    self.failures += 1
+                    delay = min(RETRY_DELAY * 2 ** (self.failures - 1), RETRY_MAX)
+                self.stopping.wait(delay)
+                continue
+            with self.lock:
+                self.generated += 1
+                self.error = None
+                self.failures = 0
+                self.latencies.append(time.perf_counter() - t)
+                del self.latencies[:-100]
+            self.keys.put((k, extra, path))
+
+    def take(self, timeout=None):
+        """
+        Return (key, prepare(key)) for a ready key, waiting for one if the
+        pool is empty, and ask for a refill.
+        The key is removed from the directory. If no key is ready after
+        timeout seconds, raise an exception with the last refill error.
+        """
+        self.start()
+        try:
+            (k, extra, path) = self.keys.get(timeout=timeout)
+        except queue.Empty:
+            with self.lock:
+                error = self.error
+            if error is None:
+                raise Exception(f"No key ready after {timeout} seconds") from None
+            raise Exception(f"No key ready after {timeout} seconds, last error: {error!r}") from error
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        self.wakeup.set()
+        return (k, extra)
+
+    def status(self):
+        """
+        Return the depth of the pool and the time in seconds it took to
+        make the last keys ready (generation or loading, and prepare), and
+        the last error if the refill has been failing since
+        """
+        with self.lock:
+            lat = list(self.latencies)
+            generated = self.generated
+            error = self.error
+            failures = self.failures
+        return {
+            "depth": self.keys.qsize(),
+            "size": self.size,
+            "generated": generated,
+            "last_latency": lat[-1] if lat else None,
+            "mean_latency": sum(lat) / len(lat) if lat else None,
+            "error": repr(error) if error is not None else None,
+            "failures": failures,
+        }
@@ -0,0 +1,191 @@
+"""
+Counters and histograms recording where signing and key generation spend
+their time.
+
+Recording is off by default (or on with NTRU_METRICS=1 in the environment)
+and then costs one attribute check per call: timer() returns a timer whose
+lap() does nothing. The values are read with snapshot(), dumped as JSON
+with dump() or in the Prometheus text format with text().
+Every process records its own values, the workers of NTRUSign.Parallel are
+not aggregated.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+enabled = os.environ.get("NTRU_METRICS", "0") not in ("", "0")
+
+# Bucket upper bounds of the timings in seconds, from 1us to about 16s
+TIME_EDGES = [1e-6 * 2**i for i in range(25)]
+# Bucket upper bounds of the signature norms
+NORM_EDGES = list(range(400, 1001, 10))
+# Bucket upper bounds of the number of attempts
+COUNT_EDGES = [2**i for i in range(20)]
+
+lock = threading.Lock()
+counters = {}
+histograms = {}
+
+
+class Histogram:
+    """
+    Counts of the observed values in the buckets ]edges[i-1];edges[i]],
+    the last bucket holding the values above every edge
+    """
+
+    def __init__(self, edges):
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "edges": self.edges,
+            "counts": self.counts,
+        }
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Forget every recorded value
+    """
+    with lock:
+        counters.clear()
+        histograms.clear()
+
+
+def count(name, n=1):
+    """
+    Add n to the counter name
+    """
+    if not enabled:
+        return
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+def observe(name, values, edges=TIME_EDGES):
+    """
+    Record one value or an iterable of values in the histogram name,
+    created with the given bucket edges on first use
+    """
+    if not enabled:
+        return
+    if not hasattr(values, "__iter__"):
+        values = (values,)
+    with lock:
+        if name not in histograms:
+            histograms[name] = Histogram(edges)
+        h = histograms[name]
+        for v in values:
+            h.observe(float(v))
+
+
+class Timer:
+    """
+    Record the time elapsed between consecutive laps in the histograms
+    prefix.name
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        observe(f"{self.prefix}.{name}", now - self.last)
+        self.last = now
+
+
+class NullTimer:
+    """
+    Timer used while recording is disabled
+    """
+
+    def lap(self, name):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timer(prefix):
+    """
+    Return a Timer for prefix, or a timer doing nothing if recording is
+    disabled
+    """
+    if not enabled:
+        return NULL_TIMER
+    return Timer(prefix)
+
+
+def snapshot():
+    """
+    Return the counters and histograms as a dictionary
+    """
+    with lock:
+        return {
+            "counters": dict(counters),
+            "histograms": {name: h.to_dict() for name, h in histograms.items()},
+        }
+
+
+def dump(path=None):
+    """
+    Return the snapshot as a JSON string, also written to path if given
+    """
+    s = json.dumps(snapshot(), indent=1)
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(s)
+    return s
+
+
+def text():
+    """
+    Return the snapshot in the Prometheus text exposition format
+    """
+    snap = snapshot()
+    lines = []
+    for name, v in sorted(snap["counters"].items()):
+        metric = "ntru_" + name.replace(".", "_")
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {v}")
+    for name, h in sorted(snap["histograms"].items()):
+        metric = "ntru_" + name.replace(".", "_")
+        lines.append(f"# TYPE {metric} histogram")
+        total = 0
+        for edge, c in zip(h["edges"], h["counts"]):
+            total += c
+            lines.append(f'{metric}_bucket{{le="{edge:g}"}} {total}')
+        lines.append(f'{metric}_bucket{{le="+Inf"}} {h["count"]}')
+        lines.append(f"{metric}_sum {h['sum']}")
+        lines.append(f"{metric}_count {h['count']}")
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,14 @@
 from NTRUSign.KeyGenerator import KeyPair
 from NTRUSign.Polynomial import Polynomial
-from multiprocessing import Pool, cpu_count
+from NTRUSign.NTT import Transformed, cyclic_convolve
+from NTRUSign import Binary
+from NTRUSign import Metrics
+from NTRUSign import Random
+from multiprocessing import cpu_count
+import contextlib
 import hashlib
+import mmap
+import os
 import numpy as np
 import time
 
@@ -11,6 +18,10 @@ try:
 except NotImplementedError:
     nproc = 1
 
+# Number of nonces r tried at once by the batched signer
+BLOCK_SIZE = 8
+
+
 def pbar(max, min, curr, r):
     """
     Print a progress bar and with value curr between max and min
@@ -26,10 +37,10 @@ def pbar(max, min, curr, r):
     print(s, end="\r")
 
 
-def H(s: bytes, N: int):
+def hash_hex(s: bytes, N: int):
     """
-    Convert the byte string to a polynomial
-    using its sha1.
+    Return the hexadecimal sha1 stream of at least N characters
+    used to build the hash polynomial of s.
     """
     h = hashlib.sha1()
     i = 0
@@ -37,27 +48,257 @@ def H(s: bytes, N: int):
     while len(m) < N:
         h.update(s+str(i).encode("ascii"))
         m += h.hexdigest()
+    return m
+
+
+def fold_codes(c, N: int):
+    """
+    Fold the rows of the character code array c onto N coefficients
+    by summing the codes of the characters i, i+N, i+2N...
+    """
+    buf = np.zeros((c.shape[0], c.shape[1] + (-c.shape[1] % N)), dtype=np.int64)
+    buf[:, :c.shape[1]] = c
+    return buf.reshape(c.shape[0], -1, N).sum(axis=1)
+
+
+def hex_to_coeff(m, N: int):
+    """
+    Fold the characters of the hexadecimal string(s) m onto N coefficients
+    by summing their codes. m is either one string or a list of strings of
+    the same length, in which case one row of coefficients is returned for
+    each of them.
+    """
+    if isinstance(m, str):
+        return hex_to_coeff([m], N)[0]
+    c = np.frombuffer("".join(m).encode("ascii"), dtype=np.uint8)
+    return fold_codes(c.reshape(len(m), -1), N)
+
+
+# ASCII codes of the hexadecimal digits
+HEX_CODES = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+# Size of the chunks read from files and iterators
+CHUNK_SIZE = 1 << 20
+
+
+def digests_to_coeff(digests, N: int):
+    """
+    Fold the hexadecimal characters of the byte strings digests, all of
+    the same length, onto N coefficients, one row per digest string
+    """
+    d = np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(len(digests), -1)
+    # Hexadecimal characters of the digests, high nibble first
+    c = np.empty((d.shape[0], 2 * d.shape[1]), dtype=np.uint8)
+    c[:, 0::2] = HEX_CODES[d >> 4]
+    c[:, 1::2] = HEX_CODES[d & 15]
+    return fold_codes(c, N)
+
+
+class DocumentHash:
+    """
+    Hash stage of the signer for one document.
+
+    The hash polynomial of D and a nonce r is built from the sha1 stream
+    of hash_hex(D+r): the state after D is computed once and forked for
+    every nonce, and the later rounds hash D again from the same buffer
+    instead of concatenating D and r.
+    The document is either bytes, a file path or an iterable of byte
+    chunks. Files are memory-mapped rather than read, iterables are
+    consumed once. close() releases the mapping, a DocumentHash is also
+    a context manager closing it on exit.
+    """
+
+    def __init__(self, D):
+        self.source = D
+        if isinstance(D, (str, os.PathLike)):
+            with open(D, "rb") as f:
+                if os.fstat(f.fileno()).st_size > 0:
+                    self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                else:
+                    self.data = b""
+        elif isinstance(D, (bytes, bytearray, memoryview)):
+            self.data = D
+        else:
+            # Later rounds hash the document again, keep the chunks
+            self.data = b"".join(D)
+        self.state = hashlib.sha1()
+        for i in range(0, len(self.data), CHUNK_SIZE):
+            self.state.update(self.data[i:i+CHUNK_SIZE])
+
+    def close(self):
+        """
+        Release the memory-mapped file, if any
+        """
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def digests(self, r, N: int):
+        """
+        Return the concatenated sha1 digests of the stream hash_hex(D+r, N)
+        """
+        suffix = r.to_bytes(10, 'big') + b"0"
+        h = self.state.copy()
+        h.update(suffix)
+        res = [h.digest()]
+        while 2 * h.digest_size * len(res) < N:
+            for i in range(0, len(self.data), CHUNK_SIZE):
+                h.update(self.data[i:i+CHUNK_SIZE])
+            h.update(suffix)
+            res.append(h.digest())
+        return b"".join(res)
+
+    def coeffs(self, rs, N: int):
+        """
+        Return the coefficients of the hash polynomials of the document
+        for every nonce of rs, as an array with one row per nonce
+        """
+        return digests_to_coeff([self.digests(r, N) for r in rs], N)
+
+    def polynomial(self, r, N: int):
+        """
+        Return the hash polynomial of the document and the nonce r
+        """
+        p = Polynomial(N=N)
+        p.coeff = self.coeffs([r], N)[0]
+        return p
+
+
+def document_hash(D):
+    """
+    Return D itself if it is already a DocumentHash, its DocumentHash
+    otherwise
+    """
+    if isinstance(D, DocumentHash):
+        return D
+    return DocumentHash(D)
+
+
+@contextlib.contextmanager
+def open_document(D):
+    """
+    Context manager giving document_hash(D), closed on exit unless D
+    already was a DocumentHash
+    """
+    doc = document_hash(D)
+    try:
+        yield doc
+    finally:
+        if doc is not D:
+            doc.close()
+
+
+def H(s: bytes, N: int):
+    """
+    Convert the byte string to a polynomial
+    using its sha1.
+    """
     p = Polynomial(N=N)
-    for i in range(len(m)):
-        p.coeff[i % N] += ord(m[i])
+    p.coeff = hex_to_coeff(hash_hex(s, N), N)
     return p
 
 
+def H_batch(D, rs, N: int):
+    """
+    Hash D concatenated with every nonce of rs,
+    return the coefficients as an array with one row per nonce.
+    D is a document accepted by DocumentHash or a DocumentHash.
+    """
+    with open_document(D) as doc:
+        return doc.coeffs(rs, N)
+
+
+def centered_norm_sq(P, q=0):
+    """
+    Squared centered Euclidean norm of every row of the coefficient array
+    P, computed in one pass over P. If q != 0 the coefficients are first
+    reduced in [0;q[, in place when P is an integer array.
+    """
+    P = np.asarray(P)
+    if q:
+        if P.dtype == np.int64 and q & (q - 1) == 0:
+            # Two's complement: the low bits are the residue modulo 2^k
+            np.bitwise_and(P, q - 1, out=P)
+        elif P.dtype == np.int64:
+            np.remainder(P, q, out=P)
+        else:
+            P = P % q
+    if P.dtype == object:
+        res = np.sum(P * P, axis=-1) - np.square(np.sum(P, axis=-1)) / P.shape[-1]
+        return np.asarray(res, dtype=np.float64)
+    sq = np.einsum('...i,...i->...', P, P)
+    return sq - np.square(np.einsum('...i->...', P)) / P.shape[-1]
+
+
 def NTRUNorm(P, Q, mod=(0, 0)):
     """
     Definition of the Centered
     Euclidean Norm
     """
-    Pc, Qc = P.coeff, Q.coeff
-    if mod[0] != 0 and mod[0]:
-        q = abs(mod[0])
-        Pc = Pc % q
-    if mod[1] != 0 and mod[1]:
-        q = abs(mod[1])
-        Qc = Qc % q
-    res_p = np.sqrt(np.sum(np.square(Pc)) - np.square(np.sum(Pc))/len(Pc))
-    res_q = np.sqrt(np.sum(np.square(Qc)) - np.square(np.sum(Qc))/len(Qc))
-    return np.sqrt(res_p**2 + res_q**2)
+    return NTRUNorm_batch(P.coeff, Q.coeff, mod)
+
+
+def NTRUNorm_batch(P, Q, mod=(0, 0)):
+    """
+    Centered Euclidean norm of every pair of rows of the
+    coefficient arrays P and Q
+    """
+    res_p = centered_norm_sq(np.array(P), abs(mod[0]))
+    res_q = centered_norm_sq(np.array(Q), abs(mod[1]))
+    return np.sqrt(res_p + res_q)
+
+
+def signature_norms(s, m0, N_bound, k: KeyPair):
+    """
+    Norms of the candidate signatures (rows of s) of the hashes m0 with the
+    key k, and the flags of those below N_bound.
+    The part of s is checked first: rows already over the bound are
+    rejected without their product by the public key and get an infinite
+    norm.
+    """
+    N = k.N
+    cs = centered_norm_sq(s)
+    live = np.sqrt(cs) < N_bound
+    b = np.full(cs.shape, np.inf)
+    if live.all():
+        t = cyclic_convolve(s, k.priv_ntt[2][0], N) - m0
+        b = np.sqrt(cs + centered_norm_sq(t, k.q))
+    elif live.any():
+        t = cyclic_convolve(s[live], k.priv_ntt[2][0], N) - m0[live]
+        b[live] = np.sqrt(cs[live] + centered_norm_sq(t, k.q))
+    return (b, b < N_bound)
+
+
+def record_norms(b):
+    """
+    Record the norms of tried signatures in the metrics, those rejected
+    before their product by the public key are only counted
+    """
+    b = np.atleast_1d(b)
+    finite = np.isfinite(b)
+    Metrics.observe("sign.norms", b[finite], Metrics.NORM_EDGES)
+    Metrics.count("sign.early_rejects", len(b) - int(np.count_nonzero(finite)))
+
+
+def perturbation(m, k: KeyPair, i, x, y):
+    """
+    Return x*f_i + y*fp_i where x and y are the rounded coordinates of the
+    rows of m in the basis of level i of the key k.
+    x and y are float work buffers of the shape of m, overwritten.
+    """
+    N = k.N
+    q = k.q
+    # The transform of m is shared by both products
+    mt = Transformed(m)
+    np.multiply(cyclic_convolve(mt, k.priv_ntt[1][i], N), -1/q, out=x, casting='unsafe')
+    np.multiply(cyclic_convolve(mt, k.priv_ntt[0][i], N), 1/q, out=y, casting='unsafe')
+    np.fix(x, out=x)
+    np.fix(y, out=y)
+    return cyclic_convolve(x, k.priv_ntt[0][i], N) + cyclic_convolve(y, k.priv_ntt[1][i], N)
 
 
 def signing_worker(params):
@@ -69,57 +310,149 @@ def signing_worker(params):
     q = k.q
     max_b = 700
     l_b = float('inf')
-    s = Polynomial(N=N)
-    x = Polynomial(N=N)
-    y = Polynomial(N=N)
+    doc = document_hash(D)
+    # Work buffers reused by every attempt
+    s = np.zeros(N, dtype=np.int64)
+    x = np.zeros(N)
+    y = np.zeros(N)
+    attempts = 0
     while True:
-        i = k.B
+        attempts += 1
+        tm = Metrics.timer("sign")
 
         # m0 is the hash of the concatenation of H and r
-        m0 = H(D+r.to_bytes(10, 'big'), k.N)
+        m0 = doc.polynomial(r, N).coeff
+        tm.lap("hash")
         m = m0
-        while i >= 1:
+        s.fill(0)
+        for i in range(k.B, 0, -1):
             # Perturb the point using the private lattice
-            x.coeff = np.fix((m.star_multiply_fft(k.priv[1][i])*(-1/q)).coeff)
-            y.coeff = np.fix((m.star_multiply_fft(k.priv[0][i])*(1/q)).coeff)
-
-            si = x.star_multiply_fft(k.priv[0][i]) + y.star_multiply_fft(k.priv[1][i])
-            m = si.star_multiply_fft(k.priv[2][i] - k.priv[2][i-1]).mod(q)
-            s = s + si
-            i -= 1
+            si = perturbation(m, k, i, x, y)
+            if i > 1:
+                m = cyclic_convolve(si, k.level_ntt[i], N) % q
+            s += si
+            tm.lap(f"level{i}")
         # Sign the perturbed point using the public lattice
-        x.coeff = np.fix((m0.star_multiply_fft(k.priv[1][0])*(-1/q)).coeff)
-        y.coeff = np.fix((m0.star_multiply_fft(k.priv[0][0])*(1/q)).coeff)
-        s0 = x.star_multiply_fft(k.priv[0][0]) + y.star_multiply_fft(k.priv[1][0])
-        s = s + s0
+        s += perturbation(m0, k, 0, x, y)
+        tm.lap("level0")
 
         # Check the signature
-        b = NTRUNorm(s, s.star_multiply_fft(k.priv[2][0]) - m0, (0, q))
-        if b < N_bound:
+        (b, accept) = signature_norms(s[None], m0[None], N_bound, k)
+        b = b[0]
+        tm.lap("norm")
+        if Metrics.enabled:
+            record_norms(b)
+        if accept[0]:
+            Metrics.count("sign.signatures")
+            Metrics.count("sign.attempts", attempts)
+            Metrics.observe("sign.attempts_until_success", attempts, Metrics.COUNT_EDGES)
             break
         elif b < l_b:
             l_b = b
         r = r + nproc
         pbar(max_b, N_bound, l_b, r)
-        s.coeff = np.zeros(N)
-        x.coeff = np.zeros(N)
-        y.coeff = np.zeros(N)
 
-    return (D, r, s)
+    res = Polynomial(N=N)
+    res.coeff = s
+    return (D, r, res)
 
 
-def Signing(k: KeyPair, D, N_bound):
-    params = [(k, D, N_bound, i) for i in range(nproc)]
-    '''
-    with Pool(nproc) as p:
-        print(f"Launching {nproc} process")
-        for res in p.imap_unordered(signing_worker, params, chunksize=1):
-            (D, r, s) = res
-            p.terminate()
-            break
-    '''
-    (D, r, s) = signing_worker(params[0])
-    return (D, r, s)
+def signing_worker_batch(params, stride=nproc, cancelled=None):
+    """
+    Sign the document D with the key k and boundary N_bound,
+    trying block nonces at once. The nonces r, r+stride, r+2*stride...
+    are tried in the same order as signing_worker so both return the same
+    signature.
+    If given, cancelled() is checked before every block and the search
+    returns None once it is True.
+    """
+    k, D, N_bound, r, block = params
+    N = k.N
+    q = k.q
+    max_b = 700
+    l_b = float('inf')
+    doc = document_hash(D)
+    # Work buffers reused by every block
+    s = np.zeros((block, N), dtype=np.int64)
+    x = np.zeros((block, N))
+    y = np.zeros((block, N))
+    attempts = 0
+    while True:
+        if cancelled is not None and cancelled():
+            return None
+        rs = [r + j*stride for j in range(block)]
+        tm = Metrics.timer("sign_batch")
+
+        # Every row of m0 is the hash of D concatenated with one nonce
+        m0 = doc.coeffs(rs, N)
+        tm.lap("hash")
+        m = m0
+        s.fill(0)
+        for i in range(k.B, 0, -1):
+            # Perturb the points using the private lattice
+            si = perturbation(m, k, i, x, y)
+            if i > 1:
+                m = cyclic_convolve(si, k.level_ntt[i], N) % q
+            s += si
+            tm.lap(f"level{i}")
+        # Sign the perturbed points using the public lattice
+        s += perturbation(m0, k, 0, x, y)
+        tm.lap("level0")
+
+        # Check the signatures, keep the first valid one
+        (b, accept) = signature_norms(s, m0, N_bound, k)
+        tm.lap("norm")
+        valid = np.flatnonzero(accept)
+        if len(valid) > 0:
+            j = valid[0]
+            if Metrics.enabled:
+                # Only the nonces up to the valid one count as attempts
+                attempts += j + 1
+                record_norms(b[:j+1])
+                Metrics.count("sign.signatures")
+                Metrics.count("sign.attempts", attempts)
+                Metrics.observe("sign.attempts_until_success", attempts, Metrics.COUNT_EDGES)
+            res = Polynomial(N=N)
+            res.coeff = s[j].copy()
+            return (D, rs[j], res)
+        if Metrics.enabled:
+            record_norms(b)
+        attempts += block
+        l_b = min(l_b, np.min(b))
+        r = rs[-1] + stride
+        pbar(max_b, N_bound, l_b, rs[-1])
+
+
+def Signing(k: KeyPair, D, N_bound, block=BLOCK_SIZE, workers=1, rng=None):
+    """
+    Sign the document D with the key k and boundary N_bound.
+    D is bytes, a file path or an iterable of byte chunks, it is hashed
+    once for every nonce tried, see DocumentHash.
+    block nonces are tried at once, block=1 uses the scalar signer.
+    With workers > 1 (or None for the default count) the nonces are split
+    between the processes of a persistent pool and the first signature
+    found is returned.
+    The nonces start at 0, or at a 32 bits value drawn from rng if given
+    (see NTRUSign.Random).
+    """
+    r0 = 0 if rng is None else int(Random.generator(rng).integers(1 << 32))
+    with open_document(D) as doc:
+        if workers is None or workers > 1:
+            from NTRUSign.Parallel import get_pool
+            pool = get_pool(workers)
+            if pool.workers > 1:
+                # The hash state can't be sent to the workers, they get the
+                # document itself and paths are opened by every worker
+                src = doc.source
+                if not isinstance(src, (bytes, str, os.PathLike)):
+                    src = bytes(doc.data)
+                (_, r, s) = pool.sign(k, src, N_bound, max(block, 1), r0)
+                return (D, r, s)
+        if block > 1:
+            (_, r, s) = signing_worker_batch((k, doc, N_bound, r0, block))
+            return (D, r, s)
+        (_, r, s) = signing_worker((k, doc, N_bound, r0))
+        return (D, r, s)
 
 
 def Verifying(D, r, s, N_bound, k: KeyPair):
@@ -127,13 +460,43 @@ def Verifying(D, r, s, N_bound, k: KeyPair):
     Verify if the document D was signed by the
     key k and boundary N_bound.
     """
-    m = H(D+r.to_bytes(10, 'big'), k.N)
-    b = NTRUNorm(s, s.star_multiply(k.pub) - m, (0, k.q))
+    with open_document(D) as doc:
+        m = doc.polynomial(r, k.N)
+    # Exact product with the cached transform of the public key
+    pub = k.pub if k.pub_ntt is None else k.pub_ntt
+    b = NTRUNorm(s, s.star_multiply_ntt(pub) - m, (0, k.q))
     if b < N_bound:
         return True
     return False
 
 
+def verify_many(sigs, N_bound, k: KeyPair, block=256):
+    """
+    Verify a list of signatures (D, r, s) made with the key k and boundary
+    N_bound, return the list of results.
+    The signatures are checked block at a time with one batched product
+    by the public key.
+    """
+    res = [None] * len(sigs)
+    batch = [i for i, (_, _, s) in enumerate(sigs) if len(s) == k.N]
+    for i in set(range(len(sigs))) - set(batch):
+        # Signatures of another length go through the scalar path
+        res[i] = Verifying(*sigs[i], N_bound, k)
+    pub = k.pub.coeff if k.pub_ntt is None else k.pub_ntt
+    for j in range(0, len(batch), block):
+        idx = batch[j:j+block]
+        S = np.stack([sigs[i][2].coeff for i in idx])
+        digests = []
+        for i in idx:
+            with open_document(sigs[i][0]) as doc:
+                digests.append(doc.digests(sigs[i][1], k.N))
+        M = digests_to_coeff(digests, k.N)
+        b = NTRUNorm_batch(S, cyclic_convolve(S, pub, k.N) - M, (0, k.q))
+        for i, ok in zip(idx, b < N_bound):
+            res[i] = bool(ok)
+    return res
+
+
 def export_signature(r, s, N_Bound, prints: bool):
     """
     Export the signature to a string.
@@ -182,6 +545,25 @@ def import_signature(sig: str):
     return r, s
 
 
+def export_signature_bin(r, s, width=None):
+    """
+    Export the signature in the binary format of NTRUSign.Binary
+    """
+    return Binary.encode_signature(r, s.coeff, width)
+
+
+def import_signature_bin(data, copy=True):
+    """
+    Import the signature from bytes previously exported by
+    export_signature_bin.
+    With copy=False the coefficients may be a read-only view of data.
+    """
+    (r, coeff) = Binary.decode_signature(data, copy)
+    s = Polynomial(N=len(coeff))
+    s.coeff = coeff
+    return r, s
+
+
 if __name__ == "__main__":
     infile = open("Alice.pdf", "rb")
     data = infile.read()
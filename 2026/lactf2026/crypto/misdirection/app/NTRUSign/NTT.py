@@ -0,0 +1,313 @@
+"""
+Exact number theoretic transform (NTT) used for the star multiplication
+in Z[X]/(X^N-1).
+
+A product is computed modulo a few NTT friendly primes and the exact
+integer result is rebuilt with the chinese remainder theorem. Every
+transform of size S = R*C is done with the four-step method: R-point and
+C-point DFT matrices applied with integer matrix products. The primes are
+small enough for the matrix products to never overflow an int64.
+
+Products with small enough coefficients (see FLOAT_BOUND) are computed
+with a float64 FFT instead, which is faster and still exact once rounded.
+"""
+
+import numpy as np
+from functools import lru_cache
+from NTRUSign.Sparse import SparseTernary
+
+# Primes of the form c*2^k+1 with k >= 22
+NTT_PRIMES = [167772161, 138412033, 113246209, 104857601]
+
+# Products whose coefficients are below this bound are computed with a
+# float64 FFT instead: the rounding error stays far below 1/2 so rounding
+# the result is still exact.
+FLOAT_BOUND = 2**36
+
+
+def primitive_root(p):
+    """
+    Return the smallest generator of (Z/pZ)*
+    """
+    factors = []
+    m = p - 1
+    d = 2
+    while d * d <= m:
+        if m % d == 0:
+            factors.append(d)
+            while m % d == 0:
+                m //= d
+        d += 1
+    if m > 1:
+        factors.append(m)
+    g = 2
+    while any(pow(g, (p - 1) // f, p) == 1 for f in factors):
+        g += 1
+    return g
+
+
+def transform_size(N):
+    """
+    Return the size of the transform used for products in Z[X]/(X^N-1).
+    When N is a power of two the cyclic convolution is computed directly,
+    otherwise the linear convolution is computed and folded.
+    """
+    if N & (N - 1) == 0:
+        return N
+    size = 1
+    while size < 2 * N - 1:
+        size <<= 1
+    return size
+
+
+class NTTPlan:
+    """
+    Twiddle tables for the transforms of size transform_size(N) modulo p
+    """
+
+    def __init__(self, N, p):
+        self.N = N
+        self.p = p
+        self.size = transform_size(N)
+        k = self.size.bit_length() - 1
+        self.R = 1 << (k // 2)
+        self.C = self.size // self.R
+        if self.C * (p - 1)**2 >= 2**63:
+            raise Exception(f"Transform of size {self.size} too large for {p}")
+        if (p - 1) % self.size != 0:
+            raise Exception(f"{p} has no root of unity of order {self.size}")
+
+        w = pow(primitive_root(p), (p - 1) // self.size, p)
+        self.forward = self.tables(w)
+        self.inverse = self.tables(pow(w, -1, p))
+        self.size_inv = pow(self.size, -1, p)
+
+    def tables(self, w):
+        """
+        Return the C-point DFT matrix, the twiddle factors and the R-point
+        DFT matrix for the root of unity w
+        """
+        powers = np.ones(self.size, dtype=np.int64)
+        for i in range(1, self.size):
+            powers[i] = powers[i-1] * w % self.p
+        (R, C, S) = (self.R, self.C, self.size)
+        WC = powers[np.outer(np.arange(C), np.arange(C)) * R % S]
+        TW = powers[np.outer(np.arange(C), np.arange(R)) % S]
+        WR = powers[np.outer(np.arange(R), np.arange(R)) * C % S]
+        return (WC, TW, WR)
+
+    def apply(self, a, tables):
+        """
+        Four-step DFT along the last axis of a
+        """
+        (WC, TW, WR) = tables
+        p = self.p
+        lead = a.shape[:-1]
+        Y = (WC @ a.reshape(lead + (self.C, self.R))) % p
+        Y *= TW
+        Y %= p
+        Z = (Y @ WR) % p
+        return np.swapaxes(Z, -1, -2).reshape(lead + (self.size,))
+
+    def transform(self, a):
+        """
+        Return the NTT of the coefficient array(s) a, zero-padded to the
+        transform size
+        """
+        a = np.asarray(a)
+        if a.dtype == object:
+            a = a % self.p
+        buf = np.zeros(a.shape[:-1] + (self.size,), dtype=np.int64)
+        buf[..., :a.shape[-1]] = a
+        buf %= self.p
+        return self.apply(buf, self.forward)
+
+    def inverse_transform(self, A):
+        """
+        Return the coefficient array(s) in [0;p[ whose NTT is A
+        """
+        a = self.apply(A, self.inverse)
+        a *= self.size_inv
+        a %= self.p
+        return a
+
+
+@lru_cache(maxsize=None)
+def get_plan(N, p):
+    """
+    Return the cached NTTPlan for (N, p)
+    """
+    return NTTPlan(N, p)
+
+
+def primes_for_bound(bound):
+    """
+    Return the NTT primes needed to recover exactly any integer of absolute
+    value at most bound, or None if there are not enough of them.
+    """
+    P = 1
+    for i, p in enumerate(NTT_PRIMES):
+        P *= p
+        if P > 2 * bound:
+            return NTT_PRIMES[:i+1]
+    return None
+
+
+def crt(residues, primes):
+    """
+    Rebuild the centered integers from their residues modulo primes
+    using Garner's algorithm.
+    """
+    t = []
+    for i, p in enumerate(primes):
+        ti = residues[i]
+        for j in range(i):
+            ti = (ti - t[j]) * pow(primes[j], -1, p) % p
+        t.append(ti)
+
+    P = 1
+    for p in primes:
+        P *= p
+    dtype = np.int64 if P < 2**62 else object
+    x = t[-1].astype(dtype)
+    for j in range(len(primes) - 2, -1, -1):
+        x = x * primes[j] + t[j].astype(dtype)
+    x[x > P // 2] -= P
+    return x
+
+
+def magnitude(a):
+    """
+    Return the largest absolute value in the coefficient array(s) a
+    """
+    if a.size == 0:
+        return 0
+    return int(np.max(np.abs(a)))
+
+
+def fold(c, N):
+    """
+    Reduce coefficient array(s) of length at most 2N-1 modulo X^N-1
+    """
+    res = c[..., :N].copy()
+    extra = c.shape[-1] - N
+    if extra > 0:
+        res[..., :extra] += c[..., N:N+extra]
+    return res
+
+
+class Transformed:
+    """
+    A coefficient array together with its NTT images, computed once per
+    prime and then reused by every product it takes part in.
+
+    It can be passed wherever a Polynomial operand of a star multiplication
+    is expected, which is used to cache the transforms of key polynomials.
+    """
+
+    def __init__(self, coeff):
+        coeff = np.asarray(coeff)
+        if coeff.dtype.kind == 'f':
+            coeff = coeff.astype(np.int64)
+        self.coeff = coeff
+        self.N = coeff.shape[-1]
+        self.bound = magnitude(coeff)
+        self.images = {}
+
+    def __len__(self):
+        return self.N
+
+    def image(self, plan):
+        """
+        Return the NTT of the coefficients for the given plan
+        """
+        key = (plan.N, plan.p)
+        if key not in self.images:
+            self.images[key] = plan.transform(self.coeff)
+        return self.images[key]
+
+    def spectrum(self, size):
+        """
+        Return the float FFT of the coefficients zero-padded to size
+        """
+        key = ("fft", size)
+        if key not in self.images:
+            self.images[key] = np.fft.rfft(self.coeff.astype(np.float64), size)
+        return self.images[key]
+
+    def precompute(self, primes=NTT_PRIMES[:1]):
+        """
+        Compute the images for the given primes ahead of time
+        """
+        for p in primes:
+            self.image(get_plan(self.N, p))
+        self.spectrum(transform_size(self.N))
+        return self
+
+
+def object_convolve(a, b):
+    """
+    Linear product of the coefficient arrays a and b with Python integers,
+    row by row for stacks of arrays (np.convolve only takes 1-D arrays)
+    """
+    shape = np.broadcast_shapes(a.shape[:-1], b.shape[:-1])
+    a = np.broadcast_to(a, shape + a.shape[-1:])
+    b = np.broadcast_to(b, shape + b.shape[-1:])
+    c = np.empty(shape + (a.shape[-1] + b.shape[-1] - 1,), dtype=object)
+    for i in np.ndindex(shape):
+        c[i] = np.convolve(a[i].astype(object), b[i].astype(object))
+    return c
+
+
+def cyclic_convolve(a, b, N):
+    """
+    Exact product of a and b in Z[X]/(X^N-1).
+    Each operand is either a coefficient array, a Transformed object or a
+    SparseTernary, which is multiplied with shifted adds when it is cheaper.
+    Arrays may be stacks of coefficient arrays (the last axis holds the
+    coefficients) as long as they broadcast together.
+    """
+    if isinstance(a, SparseTernary):
+        (a, b) = (b, a)
+    if isinstance(b, SparseTernary):
+        c = a.coeff if isinstance(a, (Transformed, SparseTernary)) else np.asarray(a)
+        if b.cheaper(c.size // max(c.shape[-1], 1)):
+            return b.multiply(c, N)
+        if b.dense is None:
+            b.dense = Transformed(b.coeff)
+        b = b.dense
+    if not isinstance(a, Transformed):
+        a = Transformed(a)
+    if not isinstance(b, Transformed):
+        b = Transformed(b)
+    bound = a.bound * b.bound * min(a.N, b.N, N)
+    if bound < FLOAT_BOUND:
+        size = transform_size(N)
+        C = a.spectrum(size) * b.spectrum(size)
+        c = np.rint(np.fft.irfft(C, size)).astype(np.int64)
+        return fold(c[..., :2 * N - 1], N)
+    primes = primes_for_bound(bound)
+    if primes is None:
+        # Too large for the available primes, use exact Python integers
+        return fold(object_convolve(a.coeff, b.coeff), N)
+
+    residues = []
+    for p in primes:
+        plan = get_plan(N, p)
+        C = a.image(plan) * b.image(plan)
+        C %= p
+        residues.append(plan.inverse_transform(C))
+    return fold(crt(residues, primes)[..., :2 * N - 1], N)
+
+
+def negacyclic_convolve(a, b, N):
+    """
+    Exact product of a and b in Z[X]/(X^N+1), with the same operands as
+    cyclic_convolve. The linear product is computed modulo X^(2N)-1 and
+    reduced with X^N = -1.
+    """
+    c = cyclic_convolve(a, b, 2 * N)
+    res = c[..., :N].copy()
+    tail = c[..., N:2 * N - 1]
+    res[..., :tail.shape[-1]] -= tail
+    return res
@@ -0,0 +1,351 @@
+import NTRUSign.KeyGenerator as KeyGenerator
+import NTRUSign.NTRU as NTRU
+import concurrent.futures
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import random
+import threading
+import time
+import atexit
+
+# Seconds between two checks that the workers are alive while waiting
+POLL_INTERVAL = 1.0
+
+
+def default_workers():
+    """
+    Number of worker processes used when none is given,
+    taken from the NTRU_WORKERS environment variable or the CPU count.
+    """
+    try:
+        return int(os.environ.get("NTRU_WORKERS", multiprocessing.cpu_count()))
+    except NotImplementedError:
+        return 1
+
+
+def worker_main(tasks, results, cancelled):
+    """
+    Main loop of a worker process.
+    The current key is received once through a "key" message and then
+    reused by every "sign" task. A task stops as soon as the shared
+    cancelled value reaches its job number. An exception raised by a task
+    is sent back as its result.
+    """
+    # Forked workers must not share the random stream of their parent
+    random.seed()
+    k = None
+    while True:
+        msg = tasks.get()
+        if msg is None:
+            break
+        if msg[0] == "key":
+            k = msg[1]
+            continue
+
+        job = msg[1]
+
+        def is_cancelled():
+            return cancelled.value >= job
+
+        try:
+            if msg[0] == "sign":
+                (D, N_bound, r, stride, block) = msg[2:]
+                with NTRU.open_document(D) as doc:
+                    res = NTRU.signing_worker_batch((k, doc, N_bound, r, block),
+                                                    stride=stride, cancelled=is_cancelled)
+                if res is not None:
+                    res = (D,) + res[1:]
+            elif msg[0] == "keygen":
+                (params, index, rng) = msg[2:]
+                res = KeyGenerator.singleWorker(params, cancelled=is_cancelled, rng=rng)
+                if res is not None:
+                    res = (index, res)
+            else:
+                raise Exception(f"Unknown task {msg[0]!r}")
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = Exception(repr(e))
+            res = e
+        if res is not None:
+            results.put((job, res))
+
+
+class WorkerPool:
+    """
+    Persistent pool of processes for signing and key generation.
+
+    The workers are started on first use and kept alive afterwards.
+    A key is shipped to every worker once, when it is first used to sign.
+    """
+
+    def __init__(self, workers=None):
+        if workers is None:
+            workers = default_workers()
+        self.workers = workers
+        self.processes = []
+        self.tasks = []
+        self.results = None
+        self.cancelled = None
+        self.job = 0
+        self.key = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the worker processes if they are not running yet
+        """
+        if self.processes:
+            return
+        ctx = multiprocessing.get_context()
+        self.results = ctx.Queue()
+        self.cancelled = ctx.Value('q', 0)
+        for _ in range(self.workers):
+            tasks = ctx.Queue()
+            p = ctx.Process(target=worker_main,
+                            args=(tasks, self.results, self.cancelled),
+                            daemon=True)
+            p.start()
+            self.tasks.append(tasks)
+            self.processes.append(p)
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        for tasks in self.tasks:
+            tasks.put(None)
+        for p in self.processes:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.terminate()
+        self.processes = []
+        self.tasks = []
+        self.key = None
+
+    def ship_key(self, k):
+        """
+        Send the key k to every worker unless it is already the current one
+        """
+        if self.key is not k:
+            for tasks in self.tasks:
+                tasks.put(("key", k))
+            self.key = k
+
+    def run(self, messages, count):
+        """
+        Send one message to each worker and return the first count results.
+        The remaining work of this job is cancelled.
+        An exception raised by a task is raised again here, and the pool is
+        stopped if a worker died (it restarts on next use).
+        """
+        self.job += 1
+        for tasks, msg in zip(self.tasks, messages):
+            tasks.put((msg[0], self.job) + msg[1:])
+        res = []
+        try:
+            while len(res) < count:
+                try:
+                    (job, r) = self.results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if not all(p.is_alive() for p in self.processes):
+                        self.close()
+                        raise Exception("A worker process died")
+                    continue
+                # Results of previously cancelled jobs can still come in
+                if job != self.job:
+                    continue
+                if isinstance(r, Exception):
+                    raise r
+                res.append(r)
+        finally:
+            if self.cancelled is not None:
+                self.cancelled.value = self.job
+        return res
+
+    def sign(self, k, D, N_bound, block=NTRU.BLOCK_SIZE, r=0):
+        """
+        Sign the document D with the key k and boundary N_bound.
+        Worker w tries the nonces r+w, r+w+W, r+w+2W... where W is the
+        number of workers so no nonce is tried twice.
+        """
+        with self.lock:
+            self.start()
+            self.ship_key(k)
+            W = self.workers
+            messages = [("sign", D, N_bound, r + w, W, block) for w in range(W)]
+            return self.run(messages, 1)[0]
+
+    def generate(self, params, count, rngs=None):
+        """
+        Run singleWorker(params) on every worker and return the
+        first count results.
+        With rngs, the i-th result is drawn from rngs[i] instead and the
+        results are returned in this order.
+        """
+        with self.lock:
+            self.start()
+            if rngs is None:
+                messages = [("keygen", params, None, None)] * self.workers
+                res = []
+                while len(res) < count:
+                    res += self.run(messages, min(self.workers, count - len(res)))
+                return [r for (_, r) in res]
+            res = []
+            for i in range(0, count, self.workers):
+                messages = [("keygen", params, j, rngs[j])
+                            for j in range(i, min(i + self.workers, count))]
+                res += self.run(messages, len(messages))
+            return [r for (_, r) in sorted(res, key=lambda x: x[0])]
+
+
+# Keys already imported by a SigningQueue worker process, by digest
+worker_keys = {}
+
+
+def sign_job(key_id, key_data, D, N_bound, block):
+    """
+    Sign D in a SigningQueue worker process. The private key is sent in the
+    binary format with every job but only imported the first time.
+    """
+    if key_id not in worker_keys:
+        k = KeyGenerator.KeyPair()
+        k.import_priv_bin(key_data)
+        k.pub = k.priv[2][0]
+        k.precompute()
+        worker_keys.clear()
+        worker_keys[key_id] = k
+    (_, r, s) = NTRU.Signing(worker_keys[key_id], D, N_bound, block=block)
+    return (r, s)
+
+
+def percentile(values, p):
+    """
+    Return the p-th percentile of the values (nearest rank)
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+class SigningQueue:
+    """
+    Queue of independent signing jobs run by a pool of processes.
+
+    Unlike WorkerPool, which splits one signature between all its workers,
+    every job is signed by a single process, so concurrent jobs run side by
+    side. submit returns a job id, the job future is found with get.
+    """
+
+    def __init__(self, workers=None, keep=1000):
+        if workers is None:
+            workers = default_workers()
+        self.workers = workers
+        self.executor = None
+        self.jobs = {}
+        self.keep = keep
+        self.ids = itertools.count(1)
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.key = None
+        self.key_data = None
+
+    def start(self):
+        """
+        Start the worker processes if they are not running yet
+        """
+        with self.lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        return self
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def submit(self, k, D, N_bound, block=NTRU.BLOCK_SIZE, callback=None):
+        """
+        Queue the signature of D with the key k, return the job id.
+        callback(r, s) is called once the signature is found.
+        """
+        self.start()
+        with self.lock:
+            if self.key is not k:
+                self.key_data = k.export_priv_bin()
+                self.key_id = hashlib.sha256(self.key_data).hexdigest()
+                self.key = k
+            job = next(self.ids)
+            start = time.perf_counter()
+            future = self.executor.submit(sign_job, self.key_id, self.key_data,
+                                          D, N_bound, block)
+            self.jobs[job] = future
+            # Forget the oldest jobs
+            for old in list(itertools.islice(self.jobs, max(0, len(self.jobs) - self.keep))):
+                del self.jobs[old]
+
+        def done(f):
+            if f.cancelled() or f.exception() is not None:
+                return
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+                del self.latencies[:-self.keep]
+            if callback is not None:
+                callback(*f.result())
+
+        future.add_done_callback(done)
+        return job
+
+    def get(self, job):
+        """
+        Return the future of the job, None if it is unknown
+        """
+        with self.lock:
+            return self.jobs.get(job)
+
+    def status(self):
+        """
+        Return the number of pending jobs and the percentiles of the
+        latencies in seconds of the last jobs
+        """
+        with self.lock:
+            lat = list(self.latencies)
+            pending = sum(not f.done() for f in self.jobs.values())
+        return {
+            "workers": self.workers,
+            "pending": pending,
+            "completed": len(lat),
+            "p50": percentile(lat, 50),
+            "p90": percentile(lat, 90),
+            "p99": percentile(lat, 99),
+        }
+
+
+pools = {}
+
+
+def get_pool(workers=None):
+    """
+    Return the persistent pool with the given number of workers,
+    starting it on first use.
+    """
+    if workers is None:
+        workers = default_workers()
+    if workers not in pools:
+        pools[workers] = WorkerPool(workers)
+    return pools[workers]
+
+
+@atexit.register
+def close_pools():
+    for pool in pools.values():
+        pool.close()
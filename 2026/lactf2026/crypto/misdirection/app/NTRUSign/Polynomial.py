@@ -1,7 +1,108 @@
 import numpy as np
 import copy
 import random
-from NTRUSign.prime_constant import PRIMES_LIST
+from NTRUSign import NTT
+from NTRUSign import Inverse
+from NTRUSign import Random
+from NTRUSign.Sparse import SparseTernary
+
+# Coefficients are stored as int64 whenever the result provably fits,
+# and as Python integers (dtype=object) once it may not.
+INT64_BOUND = 2**62
+
+
+def coeff_dtype(*arrays):
+    """
+    Return the storage dtype for a result built from the given coefficient
+    arrays: object if one of them already holds Python integers, the
+    floating dtype if one of them holds floats, int64 otherwise.
+    """
+    for a in arrays:
+        if a.dtype == object:
+            return object
+    floats = [a.dtype for a in arrays if a.dtype.kind not in "biu"]
+    if floats:
+        return np.result_type(*floats)
+    return np.int64
+
+
+def sum_dtype(a, b):
+    """
+    Return the storage dtype for a sum of the coefficient arrays a and b:
+    int64 if no coefficient can overflow, object otherwise.
+    """
+    dtype = coeff_dtype(a, b)
+    if dtype == np.int64 and NTT.magnitude(a) + NTT.magnitude(b) >= INT64_BOUND:
+        return object
+    return dtype
+
+
+def product_dtype(a, b):
+    """
+    Return the storage dtype for a convolution of the coefficient arrays
+    a and b: int64 if no partial sum can overflow, object otherwise.
+    """
+    if coeff_dtype(a, b) != np.int64 or len(a) == 0 or len(b) == 0:
+        return coeff_dtype(a, b)
+    bound = float(np.max(np.abs(a))) * float(np.max(np.abs(b))) * min(len(a), len(b))
+    if bound < INT64_BOUND:
+        return np.int64
+    return object
+
+
+def resize(coeff, n, dtype=None):
+    """
+    Return a copy of coeff truncated or zero-padded to length n
+    """
+    if dtype is None:
+        dtype = coeff_dtype(coeff)
+    res = np.zeros(n, dtype=dtype)
+    m = min(n, len(coeff))
+    res[:m] = coeff[:m]
+    return res
+
+
+def convolve(a, b):
+    """
+    Linear convolution of two coefficient arrays following the dtype policy
+    """
+    dtype = product_dtype(a, b)
+    return np.convolve(a.astype(dtype), b.astype(dtype))
+
+
+def modulus_dtype(q):
+    """
+    Return the storage dtype of coefficients reduced modulo q
+    """
+    if q < INT64_BOUND:
+        return np.int64
+    return object
+
+
+def fold(c, n):
+    """
+    Reduce a coefficient array of length at most 2n-1 modulo X^n - 1
+    """
+    res = resize(c, n)
+    if len(c) > n:
+        res[:len(c) - n] += c[n:]
+    return res
+
+
+def store(coeff, out=None):
+    """
+    Return the coefficient array coeff as a Polynomial. If out is given the
+    coefficients are copied in its array when the length and dtype match,
+    and replace it otherwise.
+    """
+    if out is None:
+        out = Polynomial(N=0)
+    if len(out) == len(coeff) and out.coeff.dtype == coeff.dtype:
+        out.coeff[...] = coeff
+    else:
+        out.coeff = coeff
+        out.N = len(coeff)
+    return out
 
 
 class Polynomial:
@@ -11,19 +112,27 @@ class Polynomial:
     Constructor :
         - Polynomial(N) create a polynomial full of zeros and of size N
         - Polynomial(N, gen=True, o=k) create the polynomial X^k of size n
+        - Polynomial(N, dtype=modulus_dtype(q)) for coefficients modulo q
+
+    The in-place operators (+=, -=, *=, %=) reuse the coefficient array
+    when the result keeps its dtype and length, and fall back to the
+    usual operator otherwise.
     """
 
-    def __init__(self, N=503, gen=False, o=0):
-        self.coeff = np.array([0 for _ in range(0, N)])
+    __slots__ = ("coeff", "N")
+
+    def __init__(self, N=503, gen=False, o=0, dtype=np.int64):
+        self.coeff = np.zeros(N, dtype=dtype)
         self.N = len(self.coeff)
         if gen:
             self.coeff[o] = 1
 
-    def construct(self, coeff):
+    def construct(self, coeff, dtype=None):
         """
-        Create a Polynomial object from an array of coefficient
+        Create a Polynomial object from an array of coefficient,
+        converted to dtype if given
         """
-        self.coeff = np.array(coeff)
+        self.coeff = np.array(coeff, dtype=dtype)
         self.N = len(self.coeff)
 
     def __len__(self):
@@ -37,17 +146,10 @@ class Polynomial:
         Define a classical addition on two polynomials.
         Entrance parameters aren't affected.
         """
-        res = Polynomial(N=max(len(self), len(other)))
-
-        for k in range(min(len(self), len(other))):
-            res.coeff[k] = self.coeff[k] + other.coeff[k]
-
-        if min(len(self), len(other)) == len(self):
-            for k in range(len(other), len(self)):
-                res.coeff[k] = other.coeff[k]
-        else:
-            for k in range(len(self), len(other)):
-                res.coeff[k] = self.coeff[k]
+        n = max(len(self), len(other))
+        res = Polynomial(N=n)
+        res.coeff = resize(self.coeff, n, sum_dtype(self.coeff, other.coeff))
+        res.coeff[:len(other)] += other.coeff
         return res
 
     def __sub__(self, other):
@@ -59,57 +161,96 @@ class Polynomial:
         tmp.coeff = -other.coeff
         return self + tmp
 
+    def in_place(self, other):
+        """
+        Return True if the sum of self and other can be stored in the
+        coefficient array of self
+        """
+        return (len(other) <= len(self)
+                and sum_dtype(self.coeff, other.coeff) == self.coeff.dtype)
+
+    def __iadd__(self, other):
+        """
+        In-place addition, self is modified
+        """
+        if not self.in_place(other):
+            return self + other
+        self.coeff[:len(other)] += other.coeff
+        return self
+
+    def __isub__(self, other):
+        """
+        In-place substraction, self is modified
+        """
+        if not self.in_place(other):
+            return self - other
+        self.coeff[:len(other)] -= other.coeff
+        return self
+
     def __mul__(self, other):
         """
         Define a classical multiplication on two polynomials or between
         an int and a polynomial
         Entrance parameters aren't affected.
         """
-        if (isinstance(other, int) or
-                isinstance(other, np.int64) or
-                isinstance(other, float)):
+        if isinstance(other, (int, float, np.integer, np.floating)):
             # If the other operand is a number (int, float, np.int64)
             res = Polynomial(N=self.N)
-            res.coeff = self.coeff * other
+            if isinstance(other, int) and abs(other) >= INT64_BOUND:
+                res.coeff = self.coeff.astype(object) * other
+            else:
+                res.coeff = self.coeff * other
 
         elif isinstance(other, Polynomial):
             # If the other operand is a polynomial
             res = Polynomial(N=len(self) + len(other))
-            for k in range(len(res)):
-                for j in range(k+1):
-                    try:
-                        res.coeff[k] += self.coeff[j]*other.coeff[k-j]
-                    except IndexError:
-                        # Polynomials have different sizes
-                        pass
+            res.coeff = resize(convolve(self.coeff, other.coeff), len(res))
         return res
 
-    def star_multiply(self, other):
+    def __imul__(self, other):
         """
-        Define the star multiplication from NTRU algorithms.
-        This is just a multiplication modulo X^n
-        Entrance parameters aren't affected.
+        In-place multiplication by an integer, self is modified.
+        Other operands give a new polynomial as with *.
         """
-        res = Polynomial(N=max(len(self), len(other)))
-        for k in range(len(res)):
-            for i in range(len(res)):
-                try:
-                    if i <= k:
-                        res.coeff[k] += self.coeff[i] * other.coeff[k-i]
-                    else:
-                        res.coeff[k] += self.coeff[i] * other.coeff[len(self)+k-i]
-                    res.coeff[k] = res.coeff[k]
-                except IndexError:
-                    # In case of one polynomial
-                    # having a bigger degree than the other
-                    res.coeff[k] += 0
+        if (isinstance(other, (int, np.integer)) and self.coeff.dtype == np.int64
+                and abs(int(other)) * NTT.magnitude(self.coeff) < INT64_BOUND):
+            self.coeff *= other
+            return self
+        return self * other
 
+    def __mod__(self, q):
+        """
+        Return a copy of the polynomial with its coefficients in [0;q[
+        """
+        res = Polynomial(N=self.N, dtype=self.coeff.dtype)
+        np.remainder(self.coeff, q, out=res.coeff)
         return res
 
-    def star_multiply_fft(self, other):
+    def __imod__(self, q):
+        """
+        In-place reduction of the coefficients in [0;q[, self is modified
+        """
+        return self.mod(q)
+
+    def star_multiply(self, other, out=None):
+        """
+        Define the star multiplication from NTRU algorithms.
+        This is just a multiplication modulo X^n - 1
+        other may also be a SparseTernary operand, multiplied in O(d*n)
+        when it is cheaper.
+        The result is stored in out if given (see store).
+        Entrance parameters aren't affected.
+        """
+        n = max(len(self), len(other))
+        if isinstance(other, SparseTernary) and other.cheaper():
+            return store(other.multiply(self.coeff, n), out)
+        return store(fold(convolve(self.coeff, other.coeff), n), out)
+
+    def star_multiply_fft(self, other, out=None):
         """
         FFT-based star multiplication (cyclic convolution).
         Computes multiplication modulo X^n - 1.
+        The result is stored in out if given (see store).
         """
         n = max(len(self), len(other))
 
@@ -123,23 +264,28 @@ class Polynomial:
             size <<= 1
 
         # FFT
-        fa = np.fft.fft(a, size)
-        fb = np.fft.fft(b, size)
+        fa = np.fft.rfft(a, size)
+        fb = np.fft.rfft(b, size)
 
-        # Pointwise multiply
-        fc = fa * fb
-
-        # Inverse FFT
-        c = np.fft.ifft(fc).real
+        # Inverse FFT of the pointwise product
+        c = np.rint(np.fft.irfft(fa * fb, size)).astype(np.int64)
 
         # Fold linear convolution into cyclic one
-        res_coeff = [0] * n
-        for i in range(2 * n - 1):
-            res_coeff[i % n] += int(round(c[i]))
+        return store(fold(c[:2 * n - 1], n), out)
 
-        res = Polynomial(N=n)
-        res.coeff = np.array(res_coeff)
-        return res
+    def star_multiply_ntt(self, other, out=None):
+        """
+        Exact NTT-based star multiplication (cyclic convolution).
+        Computes multiplication modulo X^n - 1.
+        other may also be an NTT.Transformed operand whose transforms
+        are reused, or a SparseTernary.
+        The result is stored in out if given (see store).
+        Entrance parameters aren't affected.
+        """
+        n = max(len(self), len(other))
+        if not isinstance(other, (NTT.Transformed, SparseTernary)):
+            other = other.coeff
+        return store(NTT.cyclic_convolve(self.coeff, other, n), out)
 
     def __str__(self):
         """
@@ -159,8 +305,9 @@ class Polynomial:
         or a polynomial.
         Entrance parameters aren't affected.
 
-        The polynomial division is the division of every coefficient
-        by the coefficient of the same degree in the other polynomial
+        The polynomial division is the floor division of every coefficient
+        by the integer, or by the coefficient of the same degree in the
+        other polynomial, and keeps the dtype of the coefficients.
         """
         if isinstance(other, int):
             res = Polynomial(N=self.N)
@@ -168,7 +315,7 @@ class Polynomial:
             return res
         elif isinstance(other, Polynomial):
             res = Polynomial(N=self.N)
-            res.coeff = self.coeff/other.coeff
+            res.coeff = (self.coeff // other.coeff).astype(coeff_dtype(self.coeff, other.coeff))
             return res
         else:
             raise Exception(f"Can't divide polynome by {type(other)}")
@@ -178,10 +325,10 @@ class Polynomial:
         Return the degree of the polynomial, i.e. the power of the highest
         non-zero coefficient.
         """
-        for i in range(1, self.N+1):
-            if self.coeff[self.N-i] != 0:
-                return self.N-i
-        return -1
+        nonzero = np.flatnonzero(self.coeff)
+        if len(nonzero) == 0:
+            return -1
+        return int(nonzero[-1])
 
     def mod(self, q):
         """
@@ -189,100 +336,41 @@ class Polynomial:
         i.e. put its coefficients in [0;q[
         by taking the rest of the euclidean
         division by q
+        The polynomial is modified in place, Python integer coefficients
+        are stored back as int64 when q allows it (see modulus_dtype).
         """
         self.coeff %= q
+        if self.coeff.dtype == object and modulus_dtype(q) != object:
+            self.coeff = self.coeff.astype(np.int64)
         return self
 
     def evaluate(self, x):
         """
         Evaluate the polynomial in x, i.e. return P(x)
         """
-        res = 0
-        for i in range(len(self)):
-            res += self.coeff[i] * x**i
-        return res
+        if isinstance(x, (int, np.integer)):
+            # Exact evaluation with Python integers
+            powers = np.array([int(x)], dtype=object) ** np.arange(len(self))
+            return int(np.dot(self.coeff.astype(object), powers))
+        return np.dot(self.coeff, np.power(x, np.arange(len(self))))
+
+    def sparse(self):
+        """
+        Return the SparseTernary form of a polynomial with coefficients
+        in {-1, 0, 1}
+        """
+        return SparseTernary(self.coeff)
 
     def inv(self, p):
         """
         Compute the inverse of self modulo the ideal (p, x^N-1)
         with p=q^r
-        This algorithm is an application of the
-        Extended Euclidean Algorithm
-        """
-        # Calculate if p is a power of a prime
-        # i.e. if there is p1 prime where log(p)/log(p1) is integer
-        q = 0
-        logp = np.log(p)
-        for p1 in PRIMES_LIST:
-            if p1 == p:
-                (q, r) = (p, 1)
-                break
-            res = logp/np.log(p1)
-            if abs(res-np.round(res)) < 10**(-10):
-                (q, r) = (p1, int(res))
-        if q == 0:
-            raise Exception(f'{p} is not a power of a prime')
-
-        # Variable initialization
-
-        N = len(self)
-
-        xp0 = Polynomial(N=N)
-        xp1 = Polynomial(N=N)
-        xp1.coeff[0] = 1
-        yp0 = Polynomial(N=N)
-        yp0.coeff[0] = 1
-        yp1 = Polynomial(N=N)
-
-        """
-        We will compute xp*A + yp*B = 1
-        As A is equivalent to 0 in this field
-        We will have B*yp = 1 i.e. yp=B^-1
-        """
-        B = Polynomial(N=N)
-        B.coeff = self.coeff
-
-        R = Polynomial(N=N)
-        R.coeff = self.coeff
-
-        A = Polynomial(N=N+1)
-        A.coeff[N] = 1
-        A.coeff[0] = -1 % q
-
-        while np.linalg.norm(R.coeff) != 0:
-            # Process to polynomial Long Division B/A
-            Q, R = longDivide(B, A, q)
-            (B, A) = (A, R)
-            # Increment xp and yp according to EED
-            yp0.coeff, yp1.coeff = yp1.coeff, (yp0 - Q * yp1).coeff % q
-            xp0.coeff, xp1.coeff = xp1.coeff, (xp0 - Q * xp1).coeff % q
-
-        if B.ord() > 0:
-            raise Exception("Inversion Fails")
-        # Format the result
-        c = yp0 * pow(int(B.coeff[0]), -1, q)
-        c.mod(q)
-        # Truncate the result to ensure a length of N
-        c.N = N
-        c.coeff = c.coeff[:N]
-
-        """
-        If r>1 i.e. we're trying to calculate the inverse modulo p^r
-        with p prime and r an integer.
-        We use the strategy decribed on page 27 of "NTRU: A NEW HIGH SPEED
-        PUBLIC KEY CRYPTOSYSTEM" by Jeffrey HOPSTEIN, Jill PIPHER and
-        Joseph H. SILVERMAN.
-        """
-        if r > 1:
-            p = q
-            Identity = Polynomial(N=N, gen=True, o=0)
-            while p < q**r:
-                self.q = p**2
-                cp = (self.star_multiply(c).mod(p**2) - Identity) / p
-                c.q = p**2
-                c = c - c.star_multiply(cp).mod(p) * p
-                p = p**2
-            c.mod(q**r)
+        The inverse modulo q is computed with the almost inverse
+        algorithm and lifted to q^r with Newton iterations,
+        see NTRUSign.Inverse
+        """
+        c = Polynomial(N=len(self))
+        c.coeff = Inverse.inverse(self.coeff, p)
         return c
 
 
@@ -290,19 +378,24 @@ def xgcd(A, B):
     """
     Compute the extended euclidean algorithm
     on polynomial A and B of degree 0
+    Return (u, v, d) with u*A+v*B = d = gcd(A, B) >= 0
     """
     if isinstance(A, Polynomial) and isinstance(B, Polynomial):
-        a = A.coeff[0]
-        b = B.coeff[0]
+        a = int(A.coeff[0])
+        b = int(B.coeff[0])
     else:
-        a = A
-        b = B
+        a = int(A)
+        b = int(B)
 
-    if b == 0:
-        return (1, 0, A)
-    else:
-        (x, y, g) = xgcd(b, a % b)
-        return (y, x-(a//b)*y, g)
+    # Iterative version, the resultants of NTRUSolve have thousands of bits
+    (u0, v0, u1, v1) = (1, 0, 0, 1)
+    while b != 0:
+        (k, r) = divmod(a, b)
+        (a, b) = (b, r)
+        (u0, v0, u1, v1) = (u1, v1, u0 - k * u1, v0 - k * v1)
+    if a < 0:
+        (u0, v0, a) = (-u0, -v0, -a)
+    return (u0, v0, a)
 
 
 def modXnp1(f: Polynomial, N):
@@ -310,8 +403,23 @@ def modXnp1(f: Polynomial, N):
     Reduce f mod(X^n+1)
     """
     res = Polynomial(N=N)
-    for i in range(N):
-        res.coeff[i] = f.coeff[i] - f.coeff[i+N]
+    c = resize(f.coeff, 2 * N)
+    res.coeff = c[:N] - c[N:]
+    return res
+
+
+def field_norm(c):
+    """
+    Field norm of the coefficient array c of Z[X]/(X^n+1) onto
+    Z[X]/(X^(n/2)+1): with c = c0(X^2) + X*c1(X^2) it is c0^2 - X*c1^2
+    """
+    n = len(c) // 2
+    c02 = NTT.negacyclic_convolve(c[0::2], c[0::2], n)
+    c12 = NTT.negacyclic_convolve(c[1::2], c[1::2], n)
+    # Multiply c1^2 by X modulo X^(n/2)+1
+    res = c02.copy()
+    res[1:] -= c12[:-1]
+    res[0] += c12[-1]
     return res
 
 
@@ -319,53 +427,125 @@ def N(f: Polynomial):
     """
     Compute the field norm of f
     """
-    # f0 is the list of even coefficient
-    f0 = Polynomial(N=f.N//2)
-    for i in range(f.N//2):
-        f0.coeff[i] = f.coeff[2*i]
-    # f1 is the list of even coefficient
-    f1 = Polynomial(N=f.N//2)
-    for i in range(f.N//2):
-        f1.coeff[i] = f.coeff[2*i+1]
-    f02 = modXnp1(f0*f0, f0.N)
-    f12 = modXnp1(f1*f1, f1.N)
-    xf12 = f12 * Polynomial(N=f.N, gen=True, o=1)
-    Nf = f02 - xf12
-    Nf.N = f.N//2
-    Nf.coeff = Nf.coeff[:Nf.N]
+    Nf = Polynomial(N=f.N//2)
+    Nf.coeff = field_norm(f.coeff)
     return Nf
 
 
+def galois_conjugate(c):
+    """
+    Return the coefficients of c(-X)
+    """
+    res = c.copy()
+    res[1::2] = -res[1::2]
+    return res
+
+
+def lift(c):
+    """
+    Return the coefficients of c(X^2), of twice the length of c
+    """
+    res = np.zeros(2 * len(c), dtype=c.dtype)
+    res[0::2] = c
+    return res
+
+
+def bitsize(c):
+    """
+    Number of bits of the largest coefficient of c in absolute value
+    """
+    return NTT.magnitude(c).bit_length()
+
+
+def negacyclic_fft(c, shift):
+    """
+    Evaluate c / 2^shift at the roots of X^n+1 in floating point
+    """
+    n = len(c)
+    if c.dtype == object:
+        c = np.array([int(x) >> shift for x in c], dtype=float)
+    else:
+        c = (c >> shift).astype(float)
+    return np.fft.fft(c * np.exp(1j * np.pi * np.arange(n) / n))
+
+
+def negacyclic_ifft(C):
+    """
+    Inverse of negacyclic_fft, real part of the coefficients
+    """
+    n = len(C)
+    return (np.fft.ifft(C) * np.exp(-1j * np.pi * np.arange(n) / n)).real
+
+
+def reduce(f, g, F, G):
+    """
+    Babai size reduction of (F, G) against (g, -f) in Z[X]/(X^n+1):
+    subtract k*(g, -f) with k the rounding of
+    (F*adj(g) - G*adj(f)) / (f*adj(f) + g*adj(g)), which keeps f*F+g*G.
+    Big coefficients are reduced 53 bits at a time using their leading bits
+    in floating point, the products by k are exact.
+    """
+    n = len(f)
+    size = max(53, bitsize(f), bitsize(g))
+    fa = negacyclic_fft(f, size - 53)
+    ga = negacyclic_fft(g, size - 53)
+    den = fa * fa.conj() + ga * ga.conj()
+    while True:
+        Size = max(53, bitsize(F), bitsize(G))
+        if Size < size:
+            break
+        Fa = negacyclic_fft(F, Size - 53)
+        Ga = negacyclic_fft(G, Size - 53)
+        k = np.rint(negacyclic_ifft((Fa * ga.conj() - Ga * fa.conj()) / den))
+        if not k.any():
+            break
+        k = k.astype(np.int64)
+        if Size > size:
+            k = k.astype(object) << (Size - size)
+        F = F - NTT.negacyclic_convolve(k, g, n)
+        G = G + NTT.negacyclic_convolve(k, f, n)
+    return (F, G)
+
+
+def ntru_solve(f, g, q):
+    """
+    Coefficient arrays F and G with f*F+g*G=q in Z[X]/(X^n+1),
+    n being the length of f and g and a power of two
+    """
+    n = len(f)
+    if n == 1:
+        (u, v, d) = xgcd(f[0], g[0])
+        if d != 1:
+            raise Exception(f"GCD(f,g) = {d} not equal 1")
+        return (np.array([q * u], dtype=object), np.array([q * v], dtype=object))
+    (Fp, Gp) = ntru_solve(field_norm(f), field_norm(g), q)
+    # N(f)(X^2) = f(X)*f(-X) so F = Fp(X^2)*f(-X) solves the equation at
+    # this level, it is then reduced
+    F = NTT.negacyclic_convolve(lift(Fp), galois_conjugate(f), n)
+    G = NTT.negacyclic_convolve(lift(Gp), galois_conjugate(g), n)
+    return reduce(f, g, F, G)
+
+
 def NTRUSolve(n, q, f, g):
     """
     Compute F and G satisfying f*F+g*G=q
-    with f and g in Z[X]/(X^n+1)
+    with f and g in Z[X]/(X^n+1) and n a power of two.
+    The equation is solved recursively in the tower of rings
+    Z[X]/(X^(n/2^k)+1) through field norms, and the solution of each level
+    is size reduced against (g, -f) with Babai's round-off.
     """
-    if n == 1:
-        (u, v, gcdfg) = xgcd(f, g)
-        if gcdfg != 1:
-            raise Exception(f"GCD(f,g) = {gcdfg} not equal 1")
-            return
-        Identity = Polynomial(N=1, gen=True, o=0)
-        (F, G) = (Identity*q*v, Identity*q*u)
-        return (F, G)
-    else:
-        fp = N(f)
-        gp = N(g)
-        (Fp, Gp) = NTRUSolve(n//2, q, fp, gp)
-        Fp2 = Polynomial(N=Fp.N*2)
-        for i in range(Fp.N):
-            Fp2.coeff[i*2] = Fp.coeff[i]
-            if i != 0:
-                Fp2.coeff[i*2] *= -1
-        F = modXnp1(Fp2*g, n)
-
-        Gp2 = Polynomial(N=Fp.N*2)
-        for i in range(Gp.N):
-            Gp2.coeff[i*2] = Gp.coeff[i]
-        G = modXnp1(Gp2*f, n)
-        # (F, G) = reduce(f, g, F, G)
-        return (F, G)
+    if n & (n - 1) != 0:
+        raise Exception(f"NTRUSolve needs n a power of two, got {n}")
+    (F, G) = ntru_solve(resize(f.coeff, n), resize(g.coeff, n), q)
+    res = []
+    for c in (F, G):
+        P = Polynomial(N=n)
+        if NTT.magnitude(c) < INT64_BOUND:
+            P.coeff = c.astype(np.int64)
+        else:
+            P.coeff = c
+        res.append(P)
+    return tuple(res)
 
 
 def longDivide(A, B, q=503):
@@ -375,26 +555,33 @@ def longDivide(A, B, q=503):
     """
     Q = Polynomial(N=len(A))
     R = copy.deepcopy(A)
-    for i in range(A.ord()-B.ord(), -1, -1):
+    db = B.ord()
+    if A.ord() >= db:
         try:
-            Q.coeff[i] = R.coeff[B.ord()+i] * pow(int(B.coeff[B.ord()]), -1, q)
+            lead_inv = pow(int(B.coeff[db]), -1, q)
         except ValueError:
-            raise Exception(f"Can't inverse {int(B.coeff[B.ord()])} in base {q}")
-        for j in range(B.ord()+i, i-1, -1):
-            R.coeff[j] = (R.coeff[j] - Q.coeff[i] * B.coeff[j-i]) % q
+            raise Exception(f"Can't inverse {int(B.coeff[db])} in base {q}")
+    for i in range(A.ord()-db, -1, -1):
+        Q.coeff[i] = R.coeff[db+i] * lead_inv
+        # Subtract Q[i] * X^i * B from the remainder in one pass
+        R.coeff[i:db+i+1] = (R.coeff[i:db+i+1] - Q.coeff[i] * B.coeff[:db+1]) % q
 
     return (Q, R)
 
 
-def randomGenPoly(N=503, d=2):
+def randomGenPoly(N=503, d=2, rng=None):
     """
     Generate a random binary polynomial of size N with d 1
     and (N-d) zeros.
+    The positions are drawn from rng if given (see NTRUSign.Random),
+    from the global random module otherwise.
     """
     p = Polynomial(N)
-    c = random.sample(range(N), d)
-    for e in c:
-        p.coeff[e] = 1
+    if rng is None:
+        c = random.sample(range(N), d)
+    else:
+        c = Random.sample(rng, N, d)
+    p.coeff[c] = 1
     return p
 
 
@@ -0,0 +1,38 @@
+"""
+Seedable random streams for the key generation and the signer.
+
+The functions taking an rng accept an int seed, a numpy SeedSequence or a
+numpy Generator, or None to keep using the global random module.
+Independent workers get the substreams spawned from one seed so their
+draws never overlap and a run can be replayed from its seed.
+"""
+
+import numpy as np
+
+
+def generator(rng):
+    """
+    Return the numpy Generator of rng (an int seed, a SeedSequence or a
+    Generator)
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
+
+
+def spawn(rng, n):
+    """
+    Return n independent Generators derived from rng
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng.spawn(n)
+    if not isinstance(rng, np.random.SeedSequence):
+        rng = np.random.SeedSequence(rng)
+    return [np.random.default_rng(s) for s in rng.spawn(n)]
+
+
+def sample(rng, N, d):
+    """
+    Return d distinct positions in range(N) drawn from rng
+    """
+    return generator(rng).choice(N, d, replace=False)
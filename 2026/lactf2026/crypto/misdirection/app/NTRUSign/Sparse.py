@@ -0,0 +1,95 @@
+"""
+Sparse ternary polynomials of Z[X]/(X^N-1).
+
+Key polynomials have only a few non-zero coefficients, all equal to 1
+(or -1). A SparseTernary keeps the positions of the +1 and -1
+coefficients, and its product with a dense polynomial is the sum of the
+dense coefficients shifted by every position: O(d*N) for d non-zero
+coefficients instead of a full convolution.
+"""
+
+import numpy as np
+
+# A product by a SparseTernary costs about weight*(rows+3) shifted adds of
+# N coefficients for a stack of rows dense operands. Above this budget the
+# cached dense transform is faster.
+SPARSE_BUDGET = 128
+
+
+def is_ternary(coeff):
+    """
+    Return True if every coefficient is -1, 0 or 1
+    """
+    coeff = np.asarray(coeff)
+    return coeff.dtype != object and bool(np.all(np.abs(coeff) <= 1))
+
+
+class SparseTernary:
+    """
+    A ternary coefficient array stored as the lists of the positions of its
+    +1 and -1 coefficients.
+
+    It can be passed wherever a Polynomial operand of a star multiplication
+    is expected, like NTT.Transformed.
+    """
+
+    def __init__(self, coeff):
+        coeff = np.asarray(coeff)
+        if not is_ternary(coeff):
+            raise Exception("Not a ternary polynomial")
+        self.coeff = coeff.astype(np.int64)
+        self.N = len(coeff)
+        self.plus = np.flatnonzero(coeff == 1)
+        self.minus = np.flatnonzero(coeff == -1)
+        self.bound = 1 if len(self.plus) + len(self.minus) > 0 else 0
+        self.tables = {}
+        # NTT.Transformed form used when the sparse product is not cheaper,
+        # filled by NTT.cyclic_convolve
+        self.dense = None
+
+    def __len__(self):
+        return self.N
+
+    def weight(self):
+        """
+        Return the number of non-zero coefficients
+        """
+        return len(self.plus) + len(self.minus)
+
+    def cheaper(self, rows=1):
+        """
+        Return True if the product by a stack of rows dense operands is
+        faster with shifted adds than with a transform
+        """
+        return self.weight() * (rows + 3) <= SPARSE_BUDGET
+
+    def indices(self, N):
+        """
+        Return the index arrays I with c[I[j]] the coefficients of X^i*c
+        modulo X^N-1 for the j-th position i of the +1 (resp. -1)
+        coefficients
+        """
+        if N not in self.tables:
+            k = np.arange(N)
+            self.tables[N] = tuple((k - pos[:, None]) % N for pos in (self.plus, self.minus))
+        return self.tables[N]
+
+    def multiply(self, c, N):
+        """
+        Product of the coefficient array(s) c by self in Z[X]/(X^N-1),
+        the last axis of c holds the coefficients
+        """
+        c = np.asarray(c)
+        if c.shape[-1] != N:
+            # Zero-pad c and fold it modulo X^N-1
+            M = c.shape[-1] + (-c.shape[-1] % N)
+            buf = np.zeros(c.shape[:-1] + (M,), dtype=c.dtype)
+            buf[..., :c.shape[-1]] = c
+            c = buf.reshape(c.shape[:-1] + (M // N, N)).sum(axis=-2)
+        if c.dtype.kind == 'f':
+            c = c.astype(np.int64)
+        (plus, minus) = self.indices(N)
+        res = c[..., plus].sum(axis=-2)
+        if len(minus) > 0:
+            res = res - c[..., minus].sum(axis=-2)
+        return res
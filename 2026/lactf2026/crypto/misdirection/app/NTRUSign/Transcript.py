@@ -0,0 +1,176 @@
+"""
+Statistics of signature transcripts.
+
+A signature (D, r, s) made with a key gives the vector v = (s, t) with
+t = s*h - H(D||r) reduced in [-q/2;q/2[. These vectors are spread in a
+parallelepiped spanned by the private basis, and parallelepiped learning
+recovers the basis from their moments:
+    - the second moment matrix (sum of v*v^T) is proportional to the Gram
+      matrix of the basis, and whitens the samples into a hypercube,
+    - the fourth moment of the whitened samples along a direction is
+      minimal along the edges of the hypercube.
+
+Since X^i*v is also a sample for every rotation, the second moment of all
+the rotations is kept too: it is block circulant, so it is accumulated in
+the Fourier domain as one 2x2 Hermitian matrix per frequency.
+"""
+
+import numpy as np
+from NTRUSign import NTRU
+from NTRUSign.NTT import Transformed, cyclic_convolve
+
+
+class Transcript:
+    """
+    Moments of the signatures of the key with public polynomial pub and
+    modulus q.
+
+    Signatures can be added at any time, the moments are updated in place
+    and take O(N^2) memory. With keep=True the vectors are also stored in
+    a contiguous (count x 2N) array, needed for the fourth moment (whitened
+    and descent), which takes O(count*N) memory.
+    """
+
+    def __init__(self, pub, q, keep=False, capacity=1024):
+        coeff = np.asarray(getattr(pub, "coeff", pub))
+        self.N = len(coeff)
+        self.q = q
+        self.h = Transformed(coeff).precompute()
+        self.count = 0
+        self.sum = np.zeros(2 * self.N)
+        self.gram = np.zeros((2 * self.N, 2 * self.N))
+        self.spectrum = np.zeros((self.N // 2 + 1, 2, 2), dtype=complex)
+        self.samples = np.empty((capacity, 2 * self.N)) if keep else None
+
+    def vectors(self, sigs):
+        """
+        Return the array of the vectors (s, t) of the signatures (D, r, s)
+        """
+        N = self.N
+        S = np.stack([np.asarray(s.coeff, dtype=np.int64) for (_, _, s) in sigs])
+        digests = []
+        for (D, r, _) in sigs:
+            with NTRU.open_document(D) as doc:
+                digests.append(doc.digests(r, N))
+        M = NTRU.digests_to_coeff(digests, N)
+        T = cyclic_convolve(S, self.h, N) - M
+        T = (T + self.q // 2) % self.q - self.q // 2
+        return np.hstack([S, T]).astype(np.float64)
+
+    def update(self, V):
+        """
+        Add the rows of the array V to the moments
+        """
+        V = np.ascontiguousarray(V, dtype=np.float64)
+        N = self.N
+        self.count += len(V)
+        self.sum += V.sum(axis=0)
+        self.gram += V.T @ V
+        # Fourier coefficients of the s and t halves, the rotations of a
+        # sample only change their phases
+        X = np.stack([np.fft.rfft(V[:, :N]), np.fft.rfft(V[:, N:])], axis=-1)
+        self.spectrum += np.einsum('kfa,kfb->fab', X.conj(), X)
+        if self.samples is not None:
+            n = self.count - len(V)
+            if self.count > len(self.samples):
+                grown = np.empty((max(self.count, 2 * len(self.samples)), 2 * N))
+                grown[:n] = self.samples[:n]
+                self.samples = grown
+            self.samples[n:self.count] = V
+
+    def extend(self, sigs, block=1024):
+        """
+        Add the signatures (D, r, s), block at a time
+        """
+        sigs = [sig for sig in sigs if len(sig[2]) == self.N]
+        for i in range(0, len(sigs), block):
+            self.update(self.vectors(sigs[i:i+block]))
+
+    def add(self, D, r, s):
+        """
+        Add one signature of D
+        """
+        self.extend([(D, r, s)])
+
+    def ingest(self, exported, documents):
+        """
+        Add the signatures in the text format of NTRU.export_signature,
+        exported[i] being a signature of documents[i]
+        """
+        sigs = []
+        for sig, D in zip(exported, documents):
+            (r, s) = NTRU.import_signature(sig)
+            sigs.append((D, r, s))
+        self.extend(sigs)
+
+    def mean(self):
+        """
+        Return the mean vector of the samples
+        """
+        return self.sum / self.count
+
+    def covariance(self, rotations=False):
+        """
+        Return the second moment matrix of the samples, or of the samples
+        and all their rotations
+        """
+        if not rotations:
+            return self.gram / self.count
+        N = self.N
+        # Block (a, b) is circulant: C[j, k] = c[(k-j) % N] with c the
+        # summed cyclic correlations of the halves a and b
+        corr = np.fft.irfft(self.spectrum, N, axis=0) / (self.count * N)
+        lag = (np.arange(N)[None, :] - np.arange(N)[:, None]) % N
+        C = np.empty((2 * N, 2 * N))
+        for a in range(2):
+            for b in range(2):
+                C[a*N:(a+1)*N, b*N:(b+1)*N] = corr[lag, a, b]
+        return C
+
+    def whitening(self, rotations=False):
+        """
+        Return L such that the samples times L have an identity second
+        moment. A sample uniform in the parallelepiped of a basis V is then
+        uniform in a hypercube whose edges are the rows of V*L/sqrt(3).
+        """
+        G = self.covariance(rotations)
+        return np.linalg.cholesky(np.linalg.inv(G))
+
+    def whitened(self, L):
+        """
+        Return the stored samples times L
+        """
+        if self.samples is None:
+            raise Exception("The samples were not kept, use Transcript(..., keep=True)")
+        return self.samples[:self.count] @ L
+
+    def moment4(self, U, w):
+        """
+        Fourth moment of the rows of U along w
+        """
+        return np.mean(np.square(np.square(U @ w)))
+
+    def descent(self, L=None, w=None, delta=0.7, steps=100, rng=None):
+        """
+        Minimize the fourth moment of the whitened samples on the unit
+        sphere by gradient descent from w (random if None), and return the
+        basis vector sqrt(3)*w*L^-1 of the minimum reached (up to sign).
+        """
+        if L is None:
+            L = self.whitening()
+        # Samples in the hypercube [-1;1]^n, for which delta=0.7 cancels
+        # most of the radial part of the gradient
+        U = self.whitened(L) / np.sqrt(3)
+        if w is None:
+            w = np.random.default_rng(rng).standard_normal(U.shape[1])
+        w = w / np.linalg.norm(w)
+        m = self.moment4(U, w)
+        for _ in range(steps):
+            g = 4 * U.T @ np.power(U @ w, 3) / len(U)
+            w_new = w - delta * g
+            w_new /= np.linalg.norm(w_new)
+            m_new = self.moment4(U, w_new)
+            if m_new >= m:
+                break
+            (w, m) = (w_new, m_new)
+        return np.sqrt(3) * np.linalg.solve(L.T, w)
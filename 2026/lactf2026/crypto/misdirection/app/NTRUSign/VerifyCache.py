@@ -0,0 +1,101 @@
+import NTRUSign.NTRU as NTRU
+from NTRUSign import Binary
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+
+class VerificationCache:
+    """
+    Bounded cache of the verification results of one key.
+
+    Entries are keyed by a digest of the canonical binary signature and of
+    the document, so differently formatted copies of a signature share
+    their entry. At most maxsize entries are kept, the least recently used
+    one is evicted first, and an entry expires ttl seconds after it was
+    stored (never if ttl is None).
+    """
+
+    def __init__(self, k, N_bound, maxsize=4096, ttl=None):
+        self.k = k
+        self.N_bound = N_bound
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def digest(self, D, r, s):
+        """
+        Return the cache key of the document D and the signature (r, s)
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(Binary.encode_signature(r, s.coeff, width=8))
+        h.update(D)
+        return h.digest()
+
+    def lookup(self, key):
+        """
+        Return the cached result for key, None if there is none
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.ttl is not None and entry[1] < time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def store(self, key, result):
+        """
+        Store the result for key, evicting the oldest entries if needed
+        """
+        expiry = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            self.entries[key] = (result, expiry)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def put(self, D, r, s, result=True):
+        """
+        Record the verification result of the signature (r, s) of D,
+        e.g. for signatures made with the key
+        """
+        self.store(self.digest(D, r, s), result)
+
+    def verify(self, D, r, s):
+        """
+        Verify the signature (r, s) of D, using the cached result if any
+        """
+        try:
+            key = self.digest(D, r, s)
+        except Exception:
+            # Not representable in the binary format, not cached
+            return NTRU.Verifying(D, r, s, self.N_bound, self.k)
+        result = self.lookup(key)
+        if result is None:
+            result = bool(NTRU.Verifying(D, r, s, self.N_bound, self.k))
+            self.store(key, result)
+        return result
+
+    def stats(self):
+        """
+        Return the size of the cache and its counters
+        """
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
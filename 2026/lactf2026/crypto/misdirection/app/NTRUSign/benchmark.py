@@ -0,0 +1,475 @@
+"""
+Micro-benchmarks for the NTRUSign package.
+
+Run from the application directory with:
+    python3 -m NTRUSign.benchmark
+The correctness of the fast paths is checked by the tests, run with:
+    python3 -m pytest tests
+"""
+import contextlib
+import io
+import random
+import time
+import numpy as np
+import NTRUSign.Polynomial as pn
+from NTRUSign import Inverse, Metrics, NTT
+from NTRUSign import KeyGenerator, NTRU
+from NTRUSign.Parallel import default_workers, get_pool
+
+
+def timeit(fn, repeat=5):
+    """
+    Return the best wall-clock time of fn() over repeat runs
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def report(name, N, t_ref, t_new):
+    """
+    Print one line comparing a reference timing with a new one
+    """
+    print(f"{name:<20} N={N:<4} reference {t_ref*1e3:10.3f}ms   "
+          f"new {t_new*1e3:9.3f}ms   x{t_ref/t_new:8.1f}")
+
+
+def compare(name, N, ref, new, repeat=5, repeat_ref=None):
+    """
+    Time the reference function ref and the new function new, and report
+    """
+    report(name, N, timeit(ref, repeat if repeat_ref is None else repeat_ref), timeit(new, repeat))
+
+
+def random_poly(N, low, high, rng):
+    """
+    Generate a polynomial with coefficients uniformly drawn in [low;high[
+    """
+    P = pn.Polynomial(N=N)
+    P.coeff = rng.integers(low, high, N, dtype=np.int64)
+    return P
+
+
+def quiet(fn):
+    """
+    Return fn silenced, the signer and the key generation print progress
+    """
+    def run(*args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn(*args, **kwargs)
+    return run
+
+
+def make_key(B=1, seed=0, **kwargs):
+    """
+    Generate a key pair of the default parameters from a fixed seed
+    """
+    random.seed(seed)
+    return quiet(KeyGenerator.KeyPair)(gen=True, B=B, **kwargs)
+
+
+def signer(k, documents, N_bound=545, **kwargs):
+    """
+    Return a function signing the documents 0..documents-1 with k
+    """
+    @quiet
+    def sign_all():
+        for i in range(documents):
+            NTRU.Signing(k, i.to_bytes(2, 'big'), N_bound, **kwargs)
+    return sign_all
+
+
+# Per-coefficient kernels of the original implementation, kept as a
+# reference point for the vectorized ones.
+
+def loop_add(a, b):
+    res = np.array([0 for _ in range(len(a))])
+    for k in range(len(a)):
+        res[k] = a[k] + b[k]
+    return res
+
+
+def loop_star_multiply(a, b):
+    n = len(a)
+    res = np.array([0 for _ in range(n)])
+    for k in range(n):
+        for i in range(n):
+            if i <= k:
+                res[k] += a[i] * b[k-i]
+            else:
+                res[k] += a[i] * b[n+k-i]
+    return res
+
+
+def loop_fft_fold(c, n):
+    res = [0] * n
+    for i in range(2 * n - 1):
+        res[i % n] += int(round(c[i]))
+    return np.array(res)
+
+
+def loop_modXnp1(c, n):
+    res = np.array([0 for _ in range(n)])
+    for i in range(n):
+        res[i] = c[i] - c[i+n]
+    return res
+
+
+def loop_evaluate(c, x):
+    res = 0
+    for i in range(len(c)):
+        res += int(c[i]) * x**i
+    return res
+
+
+def euclid_inv(P, p):
+    # Extended Euclidean algorithm through longDivide, with the lifting
+    # by repeated squaring, for a prime power p = q^r
+    (q, r) = Inverse.prime_power(p)
+    N = len(P)
+    xp0 = pn.Polynomial(N=N)
+    xp1 = pn.Polynomial(N=N)
+    xp1.coeff[0] = 1
+    yp0 = pn.Polynomial(N=N)
+    yp0.coeff[0] = 1
+    yp1 = pn.Polynomial(N=N)
+    B = pn.Polynomial(N=N)
+    B.coeff = P.coeff
+    R = pn.Polynomial(N=N)
+    R.coeff = P.coeff
+    A = pn.Polynomial(N=N+1)
+    A.coeff[N] = 1
+    A.coeff[0] = -1 % q
+    while np.linalg.norm(R.coeff) != 0:
+        Q, R = pn.longDivide(B, A, q)
+        (B, A) = (A, R)
+        yp0.coeff, yp1.coeff = yp1.coeff, (yp0 - Q * yp1).coeff % q
+        xp0.coeff, xp1.coeff = xp1.coeff, (xp0 - Q * xp1).coeff % q
+    if B.ord() > 0:
+        raise Exception("Inversion Fails")
+    c = yp0 * pow(int(B.coeff[0]), -1, q)
+    c.mod(q)
+    c.N = N
+    c.coeff = c.coeff[:N]
+    if r > 1:
+        p = q
+        Identity = pn.Polynomial(N=N, gen=True, o=0)
+        while p < q**r:
+            cp = (P.star_multiply(c).mod(p**2) - Identity) / p
+            c = c - c.star_multiply(cp).mod(p) * p
+            p = p**2
+        c.mod(q**r)
+    return c
+
+
+def bench_arithmetic(N, rng):
+    """
+    Compare the per-coefficient loops with the vectorized Polynomial methods
+    """
+    a = random_poly(N, -64, 64, rng)
+    b = random_poly(N, 0, 128, rng)
+    ab = a * b
+    size = 1
+    while size < 2 * N:
+        size <<= 1
+    c = np.fft.ifft(np.fft.fft(a.coeff, size) * np.fft.fft(b.coeff, size)).real
+
+    compare("add", N, lambda: loop_add(a.coeff, b.coeff), lambda: a + b)
+    compare("star_multiply", N, lambda: loop_star_multiply(a.coeff, b.coeff),
+            lambda: a.star_multiply(b), repeat_ref=2)
+    compare("star_multiply_fft", N, lambda: loop_fft_fold(c, N), lambda: a.star_multiply_fft(b))
+    compare("modXnp1", N, lambda: loop_modXnp1(ab.coeff, N), lambda: pn.modXnp1(ab, N))
+    compare("evaluate", N, lambda: loop_evaluate(a.coeff, 3), lambda: a.evaluate(3))
+
+
+def bench_star_multiply(N, rng):
+    """
+    Compare the schoolbook, float FFT and exact NTT star multiplications
+    on a hash-sized polynomial times a binary key polynomial
+    """
+    m = random_poly(N, 0, 256, rng)
+    f = pn.randomGenPoly(N, N // 3)
+    for name in ("star_multiply_fft", "star_multiply_ntt"):
+        method = getattr(m, name)
+        compare(name, N, lambda: m.star_multiply(f), lambda: method(f))
+
+
+def bench_signing(N_bound=545, documents=10):
+    """
+    Compare the signing time with and without the cached key transforms
+    """
+    k = make_key()
+    sign_all = signer(k, documents, N_bound, block=1)
+    t_new = timeit(sign_all, repeat=1)
+    cached = (k.priv_ntt, k.level_ntt)
+    # Plain coefficient arrays are transformed again by every product
+    k.priv_ntt = tuple([P.coeff for P in polys] for polys in k.priv)
+    k.level_ntt = [None] + [(k.priv[2][i] - k.priv[2][i-1]).coeff for i in range(1, k.B + 1)]
+    t_ref = timeit(sign_all, repeat=1)
+    (k.priv_ntt, k.level_ntt) = cached
+    report(f"Signing x{documents}", k.N, t_ref, t_new)
+
+
+def bench_batch_signing(N_bound=545, documents=5, blocks=(1, 4, 8, 16, 64)):
+    """
+    Measure the signing attempts per second of the scalar signer (block=1)
+    and of the batched one for several block sizes. The batched signer
+    also evaluates the nonces after the first valid one in its last block.
+    """
+    k = make_key()
+    sign = quiet(NTRU.Signing)
+    for block in blocks:
+        attempts = 0
+        t = time.perf_counter()
+        for i in range(documents):
+            (_, r, _) = sign(k, i.to_bytes(2, 'big'), N_bound, block=block)
+            attempts += (r // NTRU.nproc // block + 1) * block
+        t = time.perf_counter() - t
+        print(f"Signing block={block:<3} {attempts:6} attempts   "
+              f"{attempts/t:8.1f} attempts/s   {documents/t:6.2f} signatures/s")
+
+
+def bench_parallel(workers=None, N_bound=545, documents=10):
+    """
+    Compare the serial key generation and signing with the ones using a
+    persistent pool of processes
+    """
+    if workers is None:
+        workers = max(default_workers(), 2)
+    pool = get_pool(workers)
+    # Start the workers and ship them a key before timing anything
+    k = make_key(workers=workers)
+    signer(k, 1, N_bound, workers=workers)()
+
+    keygen = quiet(KeyGenerator.KeyPair)
+    compare(f"KeyPair B=3 w={pool.workers}", k.N, lambda: keygen(gen=True, B=3),
+            lambda: keygen(gen=True, B=3, workers=workers), repeat=1)
+    compare(f"Signing x{documents} w={pool.workers}", k.N, signer(k, documents, N_bound, workers=1),
+            signer(k, documents, N_bound, workers=workers), repeat=1)
+
+
+def bench_inverse(N, q, d):
+    """
+    Compare the Euclidean inversion with the almost inverse one on
+    an invertible random binary polynomial with d ones
+    """
+    while True:
+        f = pn.randomGenPoly(N, d)
+        try:
+            f.inv(q)
+            break
+        except Exception:
+            pass
+
+    def uncached():
+        Inverse.cache.clear()
+        return f.inv(q)
+
+    compare(f"inv q={q}", N, lambda: euclid_inv(f, q), uncached, repeat_ref=1)
+    if q & (q - 1) == 0 and q > 2:
+        # Another power of 2 for the same polynomial starts from the
+        # cached inverse modulo q
+        def lifted():
+            Inverse.cache.clear()
+            f.inv(q)
+            t = time.perf_counter()
+            f.inv(2 * q)
+            return time.perf_counter() - t
+
+        def cold():
+            Inverse.cache.clear()
+            return f.inv(2 * q)
+
+        report(f"inv q={2*q} after {q}", N, timeit(cold), min(lifted() for _ in range(5)))
+
+
+def bench_ntru_solve(n, q, tries=5):
+    """
+    Time NTRUSolve on random binary f and g with n/3 ones in Z[X]/(X^n+1)
+    """
+    times = []
+    while len(times) < tries:
+        f = pn.randomGenPoly(n, n // 3 | 1)
+        g = pn.randomGenPoly(n, n // 3 - 1)
+        t = time.perf_counter()
+        try:
+            pn.NTRUSolve(n, q, f, g)
+        except Exception:
+            continue
+        times.append(time.perf_counter() - t)
+    print(f"NTRUSolve n={n:<4} q={q:<4} {min(times)*1e3:10.3f}ms")
+
+
+def bench_serialization(B=1, N_bound=545):
+    """
+    Compare the text and binary export/import of keys and signatures
+    """
+    k = make_key(B)
+    (_, r, s) = quiet(NTRU.Signing)(k, b"benchmark", N_bound)
+    k2 = KeyGenerator.KeyPair()
+
+    t_txt = (k.export_pub(False), k.export_priv(False))
+    t_bin = (k.export_pub_bin(), k.export_priv_bin())
+    compare(f"export key B={B}", k.N, lambda: (k.export_pub(False), k.export_priv(False)),
+            lambda: (k.export_pub_bin(), k.export_priv_bin()))
+    compare(f"import key B={B}", k.N, lambda: (k2.import_pub(t_txt[0]), k2.import_priv(t_txt[1])),
+            lambda: (k2.import_pub_bin(t_bin[0]), k2.import_priv_bin(t_bin[1])))
+    print(f"key size B={B}: text {len(t_txt[0]) + len(t_txt[1])} bytes, "
+          f"binary {len(t_bin[0]) + len(t_bin[1])} bytes")
+
+    sig_txt = NTRU.export_signature(r, s, N_bound, False)
+    sig_bin = NTRU.export_signature_bin(r, s)
+    compare("import signature", k.N, lambda: NTRU.import_signature(sig_txt),
+            lambda: NTRU.import_signature_bin(sig_bin))
+
+
+def bench_hashing(size, N=251, nonces=64):
+    """
+    Compare the hash polynomials built by concatenating the document and
+    the nonce with the ones of a DocumentHash, on a random document of
+    size bytes
+    """
+    D = np.random.default_rng(0).integers(0, 256, size, dtype=np.uint8).tobytes()
+    rs = list(range(nonces))
+    doc = NTRU.DocumentHash(D)
+    compare(f"hash {size}B x{nonces}", N, lambda: [NTRU.H(D + r.to_bytes(10, 'big'), N) for r in rs],
+            lambda: doc.coeffs(rs, N), repeat=3)
+
+
+def bench_verify(count=200, N_bound=545):
+    """
+    Compare the verifications per second of the schoolbook product by the
+    public key, of Verifying and of verify_many on valid and invalid
+    signatures
+    """
+    k = make_key()
+    sigs = [quiet(NTRU.Signing)(k, i.to_bytes(2, 'big'), N_bound) for i in range(8)]
+    # Half of the signatures are checked against the wrong document
+    sigs = [(D if i % 2 else D + b"x", r, s) for i in range(count)
+            for (D, r, s) in [sigs[i % len(sigs)]]]
+
+    def schoolbook():
+        for (D, r, s) in sigs:
+            m = NTRU.H(D + r.to_bytes(10, 'big'), k.N)
+            NTRU.NTRUNorm(s, s.star_multiply(k.pub) - m, (0, k.q)) < N_bound
+
+    t_ref = timeit(schoolbook, repeat=1)
+    t_one = timeit(lambda: [NTRU.Verifying(D, r, s, N_bound, k) for (D, r, s) in sigs], repeat=3)
+    t_many = timeit(lambda: NTRU.verify_many(sigs, N_bound, k), repeat=3)
+    for (name, t) in (("schoolbook", t_ref), ("Verifying", t_one), ("verify_many", t_many)):
+        print(f"{name:<12} {count/t:10.1f} verify/s")
+
+
+def bench_sparse(N, d, rng, rows=(1, 8)):
+    """
+    Compare the dense products by a binary polynomial with d ones with the
+    shifted adds of its SparseTernary form, for a single dense operand and
+    a stack of them
+    """
+    f = pn.randomGenPoly(N, d)
+    sp = f.sparse()
+    ft = NTT.Transformed(f.coeff).precompute()
+    m = random_poly(N, 0, 1024, rng)
+    compare(f"star d={d}", N, lambda: m.star_multiply(f), lambda: sp.multiply(m.coeff, N))
+    for r in rows:
+        M = rng.integers(0, 1024, (r, N))
+        compare(f"cached x{r} d={d}", N, lambda: NTT.cyclic_convolve(M, ft, N), lambda: sp.multiply(M, N))
+
+
+def loop_norm(P, Q, q):
+    """
+    Centered norm with a separate pass for every reduction and sum
+    """
+    Q = Q % q
+    res_p = np.sqrt(np.sum(np.square(P), axis=-1) - np.square(np.sum(P, axis=-1))/P.shape[-1])
+    res_q = np.sqrt(np.sum(np.square(Q), axis=-1) - np.square(np.sum(Q, axis=-1))/Q.shape[-1])
+    return np.sqrt(res_p**2 + res_q**2)
+
+
+def bench_norm(N, rng, q=128, rows=(1, 16, 256)):
+    """
+    Compare the centered norm of stacks of candidate signatures
+    """
+    for n in rows:
+        S = rng.integers(-20, 20, (n, N))
+        T = rng.integers(-1 << 20, 1 << 20, (n, N))
+        compare(f"NTRUNorm x{n}", N, lambda: loop_norm(S, T, q),
+                lambda: NTRU.NTRUNorm_batch(S, T, (0, q)), repeat=50)
+
+
+def bench_transcript(N=251, count=2048, block=1024):
+    """
+    Compare the second moments accumulated one signature at a time with
+    the batched update of Transcript
+    """
+    from NTRUSign.Transcript import Transcript
+    rng = np.random.default_rng(0)
+    V = rng.integers(-64, 64, (count, 2 * N)).astype(np.float64)
+
+    def one_by_one():
+        G = np.zeros((2 * N, 2 * N))
+        for v in V:
+            G += np.outer(v, v)
+        return G
+
+    def batched():
+        tr = Transcript(np.zeros(N, dtype=np.int64), 128)
+        for i in range(0, count, block):
+            tr.update(V[i:i+block])
+        return tr.gram
+
+    compare(f"Transcript x{count}", N, one_by_one, batched, repeat=3, repeat_ref=1)
+
+
+def bench_metrics(N_bound=545, documents=10):
+    """
+    Compare the signing time with the metrics disabled and enabled, and
+    print the recorded time per step
+    """
+    k = make_key()
+    sign_all = signer(k, documents, N_bound, block=1)
+    enabled = Metrics.enabled
+    Metrics.disable()
+    t_ref = timeit(sign_all, repeat=3)
+    Metrics.reset()
+    Metrics.enable()
+    t_new = timeit(sign_all, repeat=3)
+    report(f"Metrics x{documents}", k.N, t_ref, t_new)
+    hists = Metrics.snapshot()["histograms"]
+    for name in ("sign.hash", "sign.level1", "sign.level0", "sign.norm"):
+        h = hists[name]
+        print(f"  {name:<20} count {h['count']:6d}   mean {h['sum']/h['count']*1e6:9.1f}us")
+    for name in ("sign.norms", "sign.attempts_until_success"):
+        h = hists[name]
+        print(f"  {name:<20} count {h['count']:6d}   mean {h['sum']/h['count']:9.1f}")
+    if not enabled:
+        Metrics.disable()
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for N in (251, 503):
+        bench_arithmetic(N, rng)
+    for N in (251, 256, 503, 512):
+        bench_star_multiply(N, rng)
+    for d in (8, 16, 32, 73):
+        bench_sparse(251, d, rng)
+    for (N, d) in ((251, 73), (503, 167)):
+        for q in (2, 3, 128, 256):
+            bench_inverse(N, q, d)
+    for n in (256, 512):
+        bench_ntru_solve(n, 128)
+    for B in (1, 3):
+        bench_serialization(B)
+    bench_norm(251, rng)
+    for size in (8, 4096, 1 << 20):
+        bench_hashing(size)
+    bench_verify()
+    bench_transcript()
+    bench_signing()
+    bench_metrics()
+    bench_batch_signing()
+    bench_parallel()
@@ -0,0 +1,205 @@
+"""
+Reproducible benchmark suite of the NTRUSign package.
+
+Every operation of every parameter set is run after a warmup with fixed
+seeds, and the statistics of its timings are stored as JSON so that two
+runs (e.g. before and after a change of backend) can be compared.
+
+Run from the application directory with:
+    python3 -m NTRUSign.suite --out results.json
+    python3 -m NTRUSign.suite --compare before.json after.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+import NTRUSign.Polynomial as pn
+from NTRUSign import Inverse, KeyGenerator, NTRU, NTT
+from NTRUSign.benchmark import quiet, random_poly
+
+# N_bound is chosen so that about one signing attempt in ten succeeds
+PARAMETER_SETS = {
+    **{f"251-B{B}": dict(N=251, q=128, df=73, dg=71, B=B, N_bound=560) for B in range(4)},
+    **{f"503-B{B}": dict(N=503, q=256, df=167, dg=166, B=B, N_bound=1600) for B in range(4)},
+}
+
+# Timings above this ratio to the reference are reported as regressions
+REGRESSION = 1.10
+
+
+def measure(fn, repeat=10, warmup=2):
+    """
+    Run fn() warmup times, then return the statistics in seconds of
+    repeat timed runs
+    """
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return {
+        "repeat": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if repeat > 1 else 0.0,
+        "max": max(times),
+    }
+
+
+def bench_set(params, repeat=10, warmup=2, seed=0):
+    """
+    Return the timing statistics of every operation for one parameter set
+    """
+    (N, q, df, dg, B, N_bound) = (params[x] for x in ("N", "q", "df", "dg", "B", "N_bound"))
+    rng = np.random.default_rng(seed)
+    res = {}
+
+    a = random_poly(N, -q // 2, q // 2, rng)
+    b = random_poly(N, -q // 2, q // 2, rng)
+    f = pn.randomGenPoly(N, df, rng)
+    res["add"] = measure(lambda: a + b, repeat, warmup)
+    res["star_multiply"] = measure(lambda: a.star_multiply(b), repeat, warmup)
+    res["star_multiply_fft"] = measure(lambda: a.star_multiply_fft(b), repeat, warmup)
+    res["star_multiply_ntt"] = measure(lambda: a.star_multiply_ntt(b), repeat, warmup)
+
+    def inv():
+        # Time the full inversion, not the cached result
+        Inverse.cache.clear()
+        return f.inv(q)
+    res["inv"] = measure(inv, repeat, warmup)
+
+    # NTRUSolve works modulo X^n+1 with n a power of two
+    n = 1 << (N - 1).bit_length()
+    fs = pn.randomGenPoly(n, df, rng)
+    gs = pn.randomGenPoly(n, dg, rng)
+    res["NTRUSolve"] = measure(lambda: pn.NTRUSolve(n, q, fs, gs), max(repeat // 5, 1), min(warmup, 1))
+
+    def keygen():
+        return KeyGenerator.KeyPair(N=N, q=q, df=df, dg=dg, B=B, gen=True, rng=seed)
+    res["keygen"] = measure(quiet(keygen), repeat, warmup)
+
+    k = quiet(keygen)()
+    documents = iter(range(1 << 30))
+    res["sign"] = measure(
+        quiet(lambda: NTRU.Signing(k, next(documents).to_bytes(4, 'big'), N_bound)), repeat, warmup
+    )
+    (D, r, s) = quiet(lambda: NTRU.Signing(k, b"benchmark", N_bound))()
+    res["verify"] = measure(lambda: NTRU.Verifying(D, r, s, N_bound, k), repeat, warmup)
+
+    pub = k.export_pub(False)
+    priv = k.export_priv(False)
+    sig = NTRU.export_signature(r, s, N_bound, False)
+    res["export_pub"] = measure(lambda: k.export_pub(False), repeat, warmup)
+    res["import_pub"] = measure(lambda: KeyGenerator.KeyPair().import_pub(pub), repeat, warmup)
+    res["export_priv"] = measure(lambda: k.export_priv(False), repeat, warmup)
+    res["import_priv"] = measure(lambda: KeyGenerator.KeyPair().import_priv(priv), repeat, warmup)
+    res["export_signature"] = measure(lambda: NTRU.export_signature(r, s, N_bound, False), repeat, warmup)
+    res["import_signature"] = measure(lambda: NTRU.import_signature(sig), repeat, warmup)
+
+    priv_bin = k.export_priv_bin()
+    sig_bin = NTRU.export_signature_bin(r, s)
+    res["export_priv_bin"] = measure(lambda: k.export_priv_bin(), repeat, warmup)
+    res["import_priv_bin"] = measure(lambda: KeyGenerator.KeyPair().import_priv_bin(priv_bin), repeat, warmup)
+    res["export_signature_bin"] = measure(lambda: NTRU.export_signature_bin(r, s), repeat, warmup)
+    res["import_signature_bin"] = measure(lambda: NTRU.import_signature_bin(sig_bin), repeat, warmup)
+    return res
+
+
+def run(names=None, repeat=10, warmup=2, seed=0, backend="numpy"):
+    """
+    Benchmark the parameter sets names (all by default), return the
+    results with the description of the environment
+    """
+    names = list(PARAMETER_SETS) if names is None else names
+    results = {
+        "meta": {
+            "backend": backend,
+            "seed": seed,
+            "repeat": repeat,
+            "warmup": warmup,
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "float_bound": NTT.FLOAT_BOUND,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "sets": {},
+    }
+    for name in names:
+        t = time.perf_counter()
+        results["sets"][name] = {
+            "params": PARAMETER_SETS[name],
+            "ops": bench_set(PARAMETER_SETS[name], repeat, warmup, seed),
+        }
+        print(f"{name:<8} done in {time.perf_counter() - t:6.1f}s", file=sys.stderr)
+    return results
+
+
+def print_results(results):
+    """
+    Print the median timing of every operation
+    """
+    for name, entry in results["sets"].items():
+        print(f"[{name}] {entry['params']}")
+        for op, st in entry["ops"].items():
+            print(f"  {op:<22} median {st['median']*1e3:10.3f}ms   "
+                  f"stdev {st['stdev']*1e3:9.3f}ms   min {st['min']*1e3:10.3f}ms")
+
+
+def compare(old, new, threshold=REGRESSION):
+    """
+    Print the ratio of the median timings of new to those of old for
+    every operation present in both, return the regressed operations
+    """
+    regressions = []
+    print(f"reference {old['meta']['backend']} ({old['meta']['time']})   "
+          f"new {new['meta']['backend']} ({new['meta']['time']})")
+    for name, entry in new["sets"].items():
+        if name not in old["sets"]:
+            continue
+        ref = old["sets"][name]["ops"]
+        for op, st in entry["ops"].items():
+            if op not in ref:
+                continue
+            ratio = st["median"] / ref[op]["median"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  REGRESSION"
+                regressions.append((name, op, ratio))
+            print(f"  {name:<8} {op:<22} {ref[op]['median']*1e3:10.3f}ms -> "
+                  f"{st['median']*1e3:10.3f}ms   x{ratio:6.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sets", nargs="*", choices=list(PARAMETER_SETS),
+                        help="parameter sets to run (all by default)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", default="numpy", help="label stored in the results")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        sys.exit(1 if compare(old, new) else 0)
+
+    results = run(args.sets, args.repeat, args.warmup, args.seed, args.backend)
+    print_results(results)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
@@ -1,7 +1,11 @@
 import os
 
 # https://github.com/Taumille/NTRUSign
-from NTRUSign import KeyGenerator, NTRU
+from NTRUSign import NTRU, Metrics
+from NTRUSign.KeyPool import KeyPool
+from NTRUSign.Parallel import SigningQueue
+from NTRUSign.VerifyCache import VerificationCache
+import concurrent.futures
 import threading
 
 from flask import Flask, make_response, request, send_from_directory, jsonify
@@ -16,26 +20,104 @@ flag = os.environ.get("FLAG", "lactf{fakeflag}")
 ready_status = {"status": False}
 zero_signature = None
 
-
-# generate keys and set up some initial data
-# this is time-consuming
-def setup():
+# count, signature cache and key are only changed while holding state_lock,
+# the lock is never held while verifying or submitting a signature
+state_lock = threading.Lock()
+
+# signatures of the new counts are computed by a pool of processes,
+# /grow waits for them at most GROW_TIMEOUT seconds
+signing_queue = SigningQueue(int(os.environ.get("SIGNING_WORKERS", os.cpu_count() or 1)))
+GROW_TIMEOUT = float(os.environ.get("GROW_TIMEOUT", 30))
+
+# verification results are kept for at most SIGNATURE_CACHE_SIZE signatures
+SIGNATURE_CACHE_SIZE = int(os.environ.get("SIGNATURE_CACHE_SIZE", 4096))
+SIGNATURE_CACHE_TTL = float(os.environ.get("SIGNATURE_CACHE_TTL", 3600))
+
+
+def sign_zero(k):
+    """
+    Sign the initial count (0) so that client can use it
+    """
+    (_, r, s) = NTRU.Signing(k, long_to_bytes(0), N_BOUND)
+    return NTRU.export_signature(r, s, N_BOUND, False)
+
+
+# keys and their zero signature are generated in the background
+# this is time-consuming, the pool keeps some ready
+key_pool = KeyPool(
+    size=int(os.environ.get("KEY_POOL_SIZE", 2)),
+    directory=os.environ.get("KEY_POOL_DIR", "keys"),
+    prepare=sign_zero,
+    B=1,
+)
+# the initial setup waits at most KEY_TIMEOUT seconds for a key from the
+# pool, /regenerate-keys at most REGENERATE_TIMEOUT seconds
+KEY_TIMEOUT = float(os.environ.get("KEY_TIMEOUT", 600))
+REGENERATE_TIMEOUT = float(os.environ.get("REGENERATE_TIMEOUT", 0))
+
+
+# set up a ready key and some initial data
+# the new key replaces the previous one at once under state_lock
+def setup(timeout=KEY_TIMEOUT):
     global NTRUKeys, current_count, zero_signature, signature_cache, ready_status
 
-    current_count = 0
-
-    NTRUKeys = KeyGenerator.KeyPair(gen=True, B=1)
+    (k, zero_sig) = key_pool.take(timeout=timeout)
 
-    # Sign the initial count (0) so that client can use it
-    (_, r, s) = NTRU.Signing(NTRUKeys, long_to_bytes(current_count), N_BOUND)
-    zero_signature = NTRU.export_signature(r, s, N_BOUND, False)
+    cache = VerificationCache(k, N_BOUND, SIGNATURE_CACHE_SIZE, SIGNATURE_CACHE_TTL)
+    (r, s) = NTRU.import_signature(zero_sig)
+    cache.put(long_to_bytes(0), r, s)
 
-    signature_cache = {zero_signature: 0}
+    with state_lock:
+        current_count = 0
+        NTRUKeys = k
+        zero_signature = zero_sig
+        signature_cache = cache
 
     ready_status["status"] = True
 
 
-setup_thread = threading.Thread(target=setup)
+def grow_response(count, sig):
+    """
+    Response of /grow once the signature of the new count is known
+    """
+    if count >= 4:
+        return {
+            "msg": f"Snake has grown to length {count}. It is too long and does not have any more food.",
+            "count": count,
+            "signature": sig,
+        }
+    return {
+        "msg": f"Snake has grown to length {count}",
+        "count": count,
+        "signature": sig,
+    }
+
+
+def job_done(k, count):
+    """
+    Return the callback storing the signature of count once it is found
+    """
+    def done(r, s):
+        with state_lock:
+            # the keys may have been regenerated meanwhile
+            if NTRUKeys is k:
+                signature_cache.put(long_to_bytes(count), r, s)
+    return done
+
+
+def initial_setup():
+    """
+    Run setup until a key is ready, the pool keeps retrying meanwhile
+    """
+    while True:
+        try:
+            setup()
+            return
+        except Exception as e:
+            print(f"Key setup failed, retrying: {e}")
+
+
+setup_thread = threading.Thread(target=initial_setup)
 setup_thread.start()
 
 
@@ -49,61 +131,92 @@ def grow():
     request_body = request.get_json()
     client_count = request_body["count"]
     count_sig = request_body["sig"]
-
-    # limit to 4 count
-    if current_count < 4 and client_count == current_count:
-        if count_sig in signature_cache and signature_cache[count_sig] == client_count:
-            verif = True
-        else:
-            try:
-                r, s = NTRU.import_signature(count_sig)
-                verif = NTRU.Verifying(
-                    long_to_bytes(client_count), r, s, N_BOUND, NTRUKeys
-                )
-            except Exception:
-                verif = False
-        if verif:
-            current_count += 1
-
-            # sign the new number
-            ready_status["status"] = False
-            (_, r, s) = NTRU.Signing(NTRUKeys, long_to_bytes(current_count), N_BOUND)
-            ready_status["status"] = True
-            new_count_sig = NTRU.export_signature(r, s, N_BOUND, False)
-            signature_cache[new_count_sig] = current_count
-            if current_count >= 4:
-                return jsonify(
-                    {
-                        "msg": f"Snake has grown to length {current_count}. It is too long and does not have any more food.",
-                        "count": current_count,
-                        "signature": new_count_sig,
-                    }
-                )
-            return jsonify(
-                {
-                    "msg": f"Snake has grown to length {current_count}",
-                    "count": current_count,
-                    "signature": new_count_sig,
-                }
-            )
-        else:
-            return jsonify(
-                {
-                    "msg": "Invalid signature!",
-                    "count": current_count,
-                    "signature": "null",
-                }
-            )
-
+    wait = request_body.get("wait", True)
+
+    def no_food():
+        return jsonify(
+            {
+                "msg": "Snake does not have enough food to grow!",
+                "count": current_count,
+                "signature": "null",
+            }
+        )
+
+    with state_lock:
+        # limit to 4 count
+        if not (current_count < 4 and client_count == current_count):
+            return no_food()
+        (k, cache) = (NTRUKeys, signature_cache)
+
+    # the verification is the slow part, other requests go on meanwhile
+    try:
+        r, s = NTRU.import_signature(count_sig)
+        verif = cache.verify(long_to_bytes(client_count), r, s)
+    except Exception:
+        verif = False
+    if not verif:
+        return jsonify(
+            {
+                "msg": "Invalid signature!",
+                "count": current_count,
+                "signature": "null",
+            }
+        )
+
+    with state_lock:
+        # another request may have grown the snake or reset the keys
+        if NTRUKeys is not k or client_count != current_count:
+            return no_food()
+        current_count += 1
+        count = current_count
+
+    # sign the new number in the background, the callback takes state_lock
+    # and may run right away
+    job = signing_queue.submit(k, long_to_bytes(count), N_BOUND, callback=job_done(k, count))
+
+    future = signing_queue.get(job)
+    if wait and future is not None:
+        try:
+            (r, s) = future.result(timeout=GROW_TIMEOUT)
+            sig = NTRU.export_signature(r, s, N_BOUND, False)
+            return jsonify(dict(grow_response(count, sig), job=job))
+        except concurrent.futures.TimeoutError:
+            pass
+    if future is None:
+        # already forgotten by the queue, it keeps the last jobs only
+        return jsonify(
+            {
+                "msg": f"Snake has grown to length {count}, signature job expired",
+                "count": count,
+                "signature": "null",
+                "job": job,
+            }
+        )
     return jsonify(
         {
-            "msg": "Snake does not have enough food to grow!",
-            "count": current_count,
+            "msg": f"Snake has grown to length {count}, signature in progress",
+            "count": count,
             "signature": "null",
+            "job": job,
         }
     )
 
 
+@app.get("/job/<int:job>")
+def get_job(job):
+    future = signing_queue.get(job)
+    if future is None:
+        return jsonify({"msg": "Unknown job", "job": job}), 404
+    if not future.done():
+        return jsonify({"job": job, "done": False})
+    if future.cancelled() or future.exception() is not None:
+        return jsonify({"msg": "Signing failed", "job": job, "done": True}), 500
+    (r, s) = future.result()
+    return jsonify(
+        {"job": job, "done": True, "signature": NTRU.export_signature(r, s, N_BOUND, False)}
+    )
+
+
 @app.post("/flag")
 def get_flag():
     global current_count, ready_status
@@ -111,22 +224,24 @@ def get_flag():
     if not ready_status["status"]:
         return jsonify({"msg": "Please wait!"})
 
-    # flag costs 14 grows
-    # snake must reach full length
-    if current_count >= 14:
-        current_count -= 14
-        return jsonify({"msg": f"Flag: {flag}", "count": current_count})
+    with state_lock:
+        # flag costs 14 grows
+        # snake must reach full length
+        if current_count >= 14:
+            current_count -= 14
+            return jsonify({"msg": f"Flag: {flag}", "count": current_count})
 
-    return jsonify({"msg": "Snake isn't long enough!", "count": current_count})
+        return jsonify({"msg": "Snake isn't long enough!", "count": current_count})
 
 
 # reset the challenge (don't need to restart instance)
 @app.get("/regenerate-keys")
 def regenerate_keys():
-    global ready_status
-    ready_status["status"] = False
-    setup()
-    ready_status["status"] = True
+    try:
+        setup(timeout=REGENERATE_TIMEOUT)
+    except Exception as e:
+        # no key is ready, the current key is still served
+        return jsonify({"msg": f"Could not regenerate keys: {e}"}), 503
     return jsonify({"msg": "Successfully Reset Challenge"})
 
 
@@ -161,7 +276,25 @@ def index():
 def status():
     global ready_status
 
-    return jsonify(ready_status)
+    return jsonify(
+        dict(
+            ready_status,
+            pool=key_pool.status(),
+            signing=signing_queue.status(),
+            cache=signature_cache.stats() if ready_status["status"] else None,
+        )
+    )
+
+
+# timings and counters of the signer and the key generation of this
+# process, recorded if NTRU_METRICS=1
+@app.get("/metrics")
+def metrics():
+    if request.args.get("format") == "json":
+        return jsonify(Metrics.snapshot())
+    resp = make_response(Metrics.text())
+    resp.mimetype = "text/plain"
+    return resp
 
 
 if __name__ == "__main__":
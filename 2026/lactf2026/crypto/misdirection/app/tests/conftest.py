@@ -0,0 +1,21 @@
+import contextlib
+import io
+import os
+import sys
+import pytest
+
+# The package is imported as NTRUSign from the application directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from NTRUSign import KeyGenerator  # noqa: E402
+
+N_BOUND = 545
+
+
+@pytest.fixture(scope="session")
+def key():
+    """
+    Key pair with B=1 of the default parameters, from a fixed seed
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return KeyGenerator.KeyPair(gen=True, B=1, rng=0)
@@ -0,0 +1,86 @@
+import pytest
+from NTRUSign import KeyPool
+
+
+@pytest.fixture(autouse=True)
+def fast_retry(monkeypatch):
+    monkeypatch.setattr(KeyPool, "RETRY_DELAY", 0.01)
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs):
+        pools.append(KeyPool.KeyPool(size=1, B=0, **kwargs))
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.stop(timeout=30)
+        assert pool.thread is None
+
+
+def test_failing_prepare_is_reported(make_pool):
+    def prepare(k):
+        raise ValueError("prepare failed")
+
+    pool = make_pool(prepare=prepare)
+    with pytest.raises(Exception, match="prepare failed"):
+        pool.take(timeout=2)
+    status = pool.status()
+    assert "prepare failed" in status["error"]
+    assert status["failures"] >= 1
+    assert status["generated"] == 0
+
+
+def test_refill_recovers_after_failures(make_pool):
+    calls = []
+
+    def prepare(k):
+        calls.append(k)
+        if len(calls) <= 2:
+            raise ValueError("transient")
+        return len(calls)
+
+    pool = make_pool(prepare=prepare)
+    (k, extra) = pool.take(timeout=30)
+    assert extra == 3
+    assert k.pub is not None
+    status = pool.status()
+    assert status["error"] is None
+    assert status["failures"] == 0
+
+
+def test_corrupt_stored_key_is_skipped(make_pool, tmp_path):
+    (tmp_path / "0-0.key").write_bytes(b"not a key")
+    pool = make_pool(directory=str(tmp_path))
+    (k, extra) = pool.take(timeout=30)
+    assert k.pub is not None
+    assert extra is None
+
+
+def test_directory_is_created_by_the_refill(make_pool, tmp_path):
+    directory = tmp_path / "keys"
+    pool = make_pool(directory=str(directory))
+    assert not directory.exists()
+    pool.take(timeout=30)
+    assert directory.is_dir()
+
+
+def test_stop_joins_the_refill_thread(make_pool):
+    pool = make_pool()
+    pool.take(timeout=30)
+    thread = pool.thread
+    pool.stop(timeout=30)
+    assert not thread.is_alive()
+    # The pool starts again on the next take
+    (k, _) = pool.take(timeout=30)
+    assert k.pub is not None
+    assert pool.thread.is_alive()
+
+
+def test_empty_pool_with_zero_timeout(make_pool):
+    pool = make_pool()
+    with pytest.raises(Exception, match="No key ready"):
+        pool.take(timeout=0)
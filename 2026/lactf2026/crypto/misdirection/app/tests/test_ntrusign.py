@@ -0,0 +1,284 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+import NTRUSign.Polynomial as pn
+from NTRUSign import Binary, Inverse, KeyGenerator, NTRU, NTT, Transcript
+from NTRUSign.benchmark import euclid_inv, loop_star_multiply, random_poly
+from conftest import N_BOUND
+
+
+def object_convolve(a, b, N):
+    """
+    Reference product in Z[X]/(X^N-1) with Python integers
+    """
+    c = np.convolve(np.asarray(a).astype(object), np.asarray(b).astype(object))
+    res = c[:N].copy()
+    res[:len(c) - N] += c[N:]
+    return res
+
+
+def sign(k, D, block=NTRU.BLOCK_SIZE):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return NTRU.Signing(k, D, N_BOUND, block=block)
+
+
+@pytest.mark.parametrize("N", [7, 251, 256, 503])
+@pytest.mark.parametrize("bits", [4, 20, 40, 70])
+def test_cyclic_convolve_matches_object(N, bits):
+    rng = np.random.default_rng(N * bits)
+    high = 1 << min(bits, 62)
+    a = rng.integers(-high, high, N)
+    b = rng.integers(-high, high, N)
+    if bits > 62:
+        # Beyond int64, only the object arrays hold the operands
+        a = a.astype(object) << (bits - 62)
+    assert np.array_equal(NTT.cyclic_convolve(a, b, N), object_convolve(a, b, N))
+
+
+def test_star_multiply_matches_schoolbook():
+    rng = np.random.default_rng(0)
+    a = random_poly(61, -64, 64, rng)
+    b = random_poly(61, 0, 128, rng)
+    ref = loop_star_multiply(a.coeff, b.coeff)
+    for name in ("star_multiply", "star_multiply_fft", "star_multiply_ntt"):
+        assert np.array_equal(getattr(a, name)(b).coeff, ref), name
+
+
+def test_transformed_stack_broadcasts():
+    rng = np.random.default_rng(1)
+    A = rng.integers(0, 1024, (5, 251))
+    f = pn.randomGenPoly(251, 73, rng)
+    ft = NTT.Transformed(f.coeff).precompute()
+    res = NTT.cyclic_convolve(A, ft, 251)
+    for i in range(5):
+        assert np.array_equal(res[i], object_convolve(A[i], f.coeff, 251))
+
+
+@pytest.mark.parametrize("q", [2, 3, 7, 128, 256])
+def test_inverse(q):
+    rng = np.random.default_rng(q)
+    while True:
+        f = pn.randomGenPoly(251, 73, rng)
+        try:
+            Inverse.cache.clear()
+            g = f.inv(q)
+            break
+        except Exception:
+            continue
+    prod = NTT.cyclic_convolve(f.coeff, g.coeff, 251) % q
+    assert prod[0] == 1 and not prod[1:].any()
+    assert np.array_equal(g.coeff % q, euclid_inv(f, q).coeff % q)
+
+
+@pytest.mark.parametrize("n", [8, 64, 256])
+def test_ntru_solve(n):
+    rng = np.random.default_rng(n)
+    q = 128
+    for _ in range(50):
+        f = pn.randomGenPoly(n, n // 3 | 1, rng)
+        g = pn.randomGenPoly(n, n // 3 - 1, rng)
+        try:
+            (F, G) = pn.NTRUSolve(n, q, f, g)
+            break
+        except Exception:
+            continue
+    else:
+        pytest.fail("no solvable (f, g) drawn")
+    r = NTT.negacyclic_convolve(f.coeff, F.coeff, n) + NTT.negacyclic_convolve(g.coeff, G.coeff, n)
+    assert r[0] == q and not r[1:].any()
+
+
+def test_signing_block_sizes_agree(key):
+    for D in (b"", b"document"):
+        (_, r1, s1) = sign(key, D, block=1)
+        (_, r8, s8) = sign(key, D, block=8)
+        assert r1 == r8
+        assert np.array_equal(s1.coeff, s8.coeff)
+
+
+def test_verify_many_matches_verifying(key):
+    sigs = [sign(key, i.to_bytes(2, 'big')) for i in range(4)]
+    # Every other signature is checked against the wrong document
+    sigs = [(D if i % 2 else D + b"x", r, s) for i, (D, r, s) in enumerate(sigs * 2)]
+    expected = [NTRU.Verifying(D, r, s, N_BOUND, key) for (D, r, s) in sigs]
+    assert expected == [i % 2 == 1 for i in range(len(sigs))]
+    assert NTRU.verify_many(sigs, N_BOUND, key) == expected
+
+
+def same_key(k, k2):
+    return (np.array_equal(k2.pub.coeff, k.pub.coeff) and
+            all(np.array_equal(P.coeff, Q.coeff)
+                for (X, Y) in zip(k.priv, k2.priv) for (P, Q) in zip(X, Y)))
+
+
+def test_key_round_trip(key):
+    k2 = KeyGenerator.KeyPair()
+    k2.import_pub(key.export_pub(False))
+    k2.import_priv(key.export_priv(False))
+    assert same_key(key, k2)
+    k3 = KeyGenerator.KeyPair()
+    k3.import_pub_bin(key.export_pub_bin())
+    k3.import_priv_bin(key.export_priv_bin())
+    assert same_key(key, k3)
+
+
+def test_signature_round_trip(key):
+    (D, r, s) = sign(key, b"round trip")
+    for (r2, s2) in (NTRU.import_signature(NTRU.export_signature(r, s, N_BOUND, False)),
+                     NTRU.import_signature_bin(NTRU.export_signature_bin(r, s))):
+        assert r2 == r
+        assert np.array_equal(s2.coeff, s.coeff)
+        assert NTRU.Verifying(D, r2, s2, N_BOUND, key)
+
+
+@pytest.mark.parametrize("width", [None, 8])
+def test_imported_signature_is_writable(key, width):
+    (D, r, s) = sign(key, b"mutate")
+    (_, s2) = NTRU.import_signature_bin(NTRU.export_signature_bin(r, s, width))
+    s2 += s2
+    assert np.array_equal(s2.coeff, 2 * s.coeff)
+    s2.mod(7)
+    assert np.array_equal(s2.coeff, (2 * s.coeff) % 7)
+
+
+@pytest.mark.parametrize("width", [None, 8])
+def test_imported_key_is_writable(key, tmp_path, width):
+    path = tmp_path / "key.bin"
+    path.write_bytes(key.export_priv_bin(width))
+    k2 = KeyGenerator.KeyPair()
+    k2.import_priv_bin(Binary.map_file(path))
+    k2.import_pub_bin(key.export_pub_bin(width))
+    for (P, Q) in [(k2.pub, key.pub)] + [(X[0], Y[0]) for (X, Y) in zip(k2.priv, key.priv)]:
+        P += P
+        P.mod(5)
+        assert np.array_equal(P.coeff, (2 * Q.coeff) % 5)
+
+
+def test_zero_copy_import_is_opt_in(key):
+    data = NTRU.export_signature_bin(1, key.pub, 8)
+    (_, s2) = NTRU.import_signature_bin(data, copy=False)
+    assert not s2.coeff.flags.writeable
+    assert np.array_equal(s2.coeff, key.pub.coeff)
+
+
+def is_inverse(f, g, q):
+    prod = NTT.cyclic_convolve(f.coeff, g.coeff, len(f.coeff)) % q
+    return prod[0] == 1 and not prod[1:].any()
+
+
+@pytest.mark.parametrize("first", [2, 16, 128, 256])
+def test_inverse_cache_congruent_mod_prime_only(first):
+    # f and g share their residues modulo 2 but not modulo 4, so the
+    # cached inverse of f must not be returned for g
+    rng = np.random.default_rng(first)
+    while True:
+        f = pn.randomGenPoly(251, 73, rng)
+        try:
+            f.inv(2)
+            break
+        except Exception:
+            continue
+    g = pn.Polynomial(N=251)
+    g.coeff = f.coeff.copy()
+    g.coeff[3] += 2
+    Inverse.cache.clear()
+    assert is_inverse(f, f.inv(first), first)
+    assert is_inverse(g, g.inv(128), 128)
+    assert is_inverse(f, f.inv(128), 128)
+
+
+def test_cyclic_convolve_object_stack():
+    # Coefficients beyond the primes of the NTT fall back to Python
+    # integers, row by row for a stack
+    rng = np.random.default_rng(2)
+    A = rng.integers(-1000, 1000, (3, 61)).astype(object)
+    A[1, 4] += 1 << 95
+    b = rng.integers(0, 128, 61)
+    res = NTT.cyclic_convolve(A, b, 61)
+    for i in range(3):
+        assert np.array_equal(res[i], object_convolve(A[i], b, 61))
+
+
+def test_verify_many_mixed_batch(key):
+    sigs = [sign(key, bytes([i])) for i in range(3)]
+    (D, r, s) = sigs[1]
+    big = pn.Polynomial(N=key.N)
+    big.coeff = s.coeff.astype(object)
+    big.coeff[5] += 1 << 95
+    sigs.append((D, r, big))
+    expected = [NTRU.Verifying(D, r, s, N_BOUND, key) for (D, r, s) in sigs]
+    assert expected == [True, True, True, False]
+    assert NTRU.verify_many(sigs, N_BOUND, key) == expected
+
+
+def test_transcript_keeps_samples_on_request(key):
+    sigs = [sign(key, bytes([i])) for i in range(4)]
+    tr = Transcript.Transcript(key.pub, key.q)
+    tr.extend(sigs)
+    assert tr.samples is None
+    with pytest.raises(Exception, match="keep=True"):
+        tr.whitened(np.eye(2 * key.N))
+    kept = Transcript.Transcript(key.pub, key.q, keep=True, capacity=2)
+    kept.extend(sigs)
+    assert np.array_equal(kept.whitened(np.eye(2 * key.N)), tr.vectors(sigs))
+    assert np.array_equal(kept.gram, tr.gram)
+
+
+def poly(coeff, dtype=None):
+    P = pn.Polynomial(N=0)
+    P.construct(coeff, dtype)
+    return P
+
+
+def test_add_float_operand_falls_back():
+    p = poly([1, 2, 3], np.int64)
+    f = poly([0.5, 0.25, 0.0])
+    q = p
+    q += f
+    assert q is not p
+    assert q.coeff.dtype == np.float64
+    assert np.array_equal(q.coeff, [1.5, 2.25, 3.0])
+    q -= f
+    assert np.array_equal(q.coeff, [1, 2, 3])
+    assert np.array_equal(p.coeff, [1, 2, 3])
+
+
+def test_add_promotes_before_overflow():
+    p = poly([2**62, -1], np.int64)
+    assert (p + p).coeff.dtype == object
+    assert list((p + p).coeff) == [2**63, -2]
+    assert list((p - poly([-2**62])).coeff) == [2**63, -1]
+    q = p
+    q += p
+    assert q is not p and list(q.coeff) == [2**63, -2]
+    small = poly([1, -1], np.int64)
+    small += small
+    assert small.coeff.dtype == np.int64 and list(small.coeff) == [2, -2]
+
+
+def test_divide_keeps_integer_dtype():
+    p = poly([7, -7, 9], np.int64)
+    res = p / poly([2, 2, 3], np.int64)
+    assert res.coeff.dtype == np.int64
+    assert list(res.coeff) == [3, -4, 3]
+    big = poly([2**70, 5], object)
+    assert list((big / poly([2**10, 2])).coeff) == [2**60, 2]
+
+
+def test_document_mapping_is_closed(key, tmp_path):
+    path = tmp_path / "doc.bin"
+    path.write_bytes(b"mapped document" * 100)
+    with NTRU.open_document(path) as doc:
+        assert not doc.data.closed
+    assert doc.data.closed
+    with NTRU.DocumentHash(path) as kept:
+        with NTRU.open_document(kept) as doc:
+            assert doc is kept
+        assert not kept.data.closed
+        (D, r, s) = sign(key, kept)
+        assert NTRU.Verifying(kept, r, s, N_BOUND, key)
+    assert kept.data.closed
+    (D, r2, s2) = sign(key, path)
+    assert (r2, list(s2.coeff)) == (r, list(s.coeff))
+    assert NTRU.Verifying(path, r, s, N_BOUND, key)
@@ -0,0 +1,60 @@
+import contextlib
+import io
+import time
+import pytest
+from NTRUSign import KeyGenerator, Parallel
+
+
+@pytest.fixture
+def pool():
+    pool = Parallel.WorkerPool(2)
+    yield pool
+    pool.close()
+
+
+def test_worker_exception_is_raised(pool, monkeypatch):
+    monkeypatch.setitem(Parallel.pools, 2, pool)
+    with pytest.raises(Exception, match="power of two"):
+        KeyGenerator.KeyPair(N=251, t='standard', gen=True, B=0, workers=2)
+    # The pool keeps working after a failed job
+    with contextlib.redirect_stdout(io.StringIO()):
+        k = KeyGenerator.KeyPair(gen=True, B=0, workers=2)
+    assert k.N == 251
+
+
+def test_unknown_task_is_raised(pool):
+    pool.start()
+    with pytest.raises(Exception, match="Unknown task"):
+        pool.run([("nothing",)] * pool.workers, 1)
+
+
+def test_dead_worker_is_detected(pool, monkeypatch):
+    monkeypatch.setattr(Parallel, "POLL_INTERVAL", 0.1)
+    pool.start()
+    pool.processes[0].kill()
+    pool.processes[0].join()
+    with pytest.raises(Exception, match="died"):
+        pool.run([], 1)
+    assert pool.processes == []
+
+
+def test_signing_queue_callback_and_eviction(key):
+    from NTRUSign import NTRU
+    from conftest import N_BOUND
+    signed = []
+    q = Parallel.SigningQueue(1, keep=1)
+    try:
+        first = q.submit(key, b"1", N_BOUND, callback=lambda r, s: signed.append(r))
+        future = q.get(first)
+        (r, s) = future.result(timeout=60)
+        assert NTRU.Verifying(b"1", r, s, N_BOUND, key)
+        second = q.submit(key, b"2", N_BOUND, callback=lambda r, s: signed.append(r))
+        q.get(second).result(timeout=60)
+        assert q.get(first) is None
+        # The callbacks run once the futures are done, maybe after result
+        deadline = time.monotonic() + 10
+        while len(signed) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(signed) == 2
+    finally:
+        q.close()